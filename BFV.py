@@ -1,10 +1,7 @@
 import pandas as pd
 import numpy as np
 import tenseal as ts
-import time
-import psutil
-from memory_profiler import memory_usage
-import gc  # Import garbage collection module
+from fhe_params import plan_frame, build_context
 
 # Sample healthcare dataset
 def generate_large_dataset(num_rows):
@@ -20,84 +17,52 @@ def generate_large_dataset(num_rows):
     }
     return pd.DataFrame(data)
 
-# Setup TenSEAL context
-def setup_tenseal():
-    context = ts.context(
-        ts.SCHEME_TYPE.BFV,
-        poly_modulus_degree=8192,
-        plain_modulus=1032193
-    )
-    context.generate_galois_keys()
-    return context
+# Setup TenSEAL context with the smallest secure parameters for the data and operation
+def setup_tenseal(df, operation):
+    # The planner picks a plain_modulus (a batching prime) large enough that the doubled
+    # values do not wrap
+    plan = plan_frame('BFV', df, operation)
+    # Element-wise operations never rotate, so no Galois keys
+    return build_context(plan)
 
-# Encryption and decryption functions
-def encrypt_data(data, context):
-    return ts.bfv_vector(context, [int(data)])
+# BFV batching packs poly_modulus_degree integers into one ciphertext
+def slot_count(context):
+    return context.seal_context().data.key_context_data().parms().poly_modulus_degree()
 
-def decrypt_data(encrypted_data):
-    return encrypted_data.decrypt()[0]
+# Encryption, computation and decryption of whole columns (timed separately by benchmark.py)
+def encrypt_column(values, context):
+    # One packed ciphertext per slot_count values; floats are truncated to integers
+    step = slot_count(context)
+    values = np.asarray(values).astype(np.int64)
+    return [ts.bfv_vector(context, values[start:start + step].tolist()) for start in range(0, len(values), step)]
+
+def compute_data(encrypted_value, operation):
+    if operation == 'addition':
+        return encrypted_value + encrypted_value  # Example: doubling the value
+    elif operation == 'multiplication':
+        return encrypted_value * 2  # Example: doubling the value
+    raise ValueError("Invalid operation")
+
+def decrypt_column(encrypted_column, context, length):
+    secret_key = context.secret_key()
+    decrypted = [np.asarray(encrypted_value.decrypt(secret_key), dtype=np.int64) for encrypted_value in encrypted_column]
+    return np.concatenate(decrypted)[:length] if decrypted else np.array([], dtype=np.int64)
 
 # Process data function
 def process_data(df, operation):
-    context = setup_tenseal()
+    context = setup_tenseal(df, operation)
     results = df.copy()
     
     for column in df.columns:
         if df[column].dtype in ['int64', 'float64']:
-            for i in range(len(df)):
-                encrypted_value = encrypt_data(df[column][i], context)
-                if operation == 'addition':
-                    processed_value = encrypted_value + encrypted_value  # Example: doubling the value
-                elif operation == 'multiplication':
-                    processed_value = encrypted_value * 2  # Example: doubling the value
-                results.at[i, column] = decrypt_data(processed_value)
+            encrypted_column = encrypt_column(df[column].to_numpy(), context)
+            processed_column = [compute_data(encrypted_value, operation) for encrypted_value in encrypted_column]
+            results[column] = decrypt_column(processed_column, context, len(df)).astype(df[column].dtype)
     
     return results
-def get_avg_memory_usage(interval=0.1, duration=1):
-    mem_usage = memory_usage(interval=interval, timeout=duration)
-    return np.mean(mem_usage)
 
 if __name__ == "__main__":
-    operation = 'addition'  # Example operation, can be 'multiplication' as well
-    num_rows = 6000  # Number of rows in the dataset
-    df = generate_large_dataset(num_rows)
-    
-    # Measure start time and CPU usage
-    start_time = time.time()
-    process = psutil.Process()
-    start_cpu_times = process.cpu_times()
-    start_memory = get_avg_memory_usage()
-    start_ctx_switches = process.num_ctx_switches()
-    
-    # Perform garbage collection before starting the main task to minimize fluctuations
-    gc.collect()
-    
-    # Perform processing on the dataset and measure peak memory usage
-    peak_memory_usage = memory_usage((process_data, (df, operation)), interval=0.1, max_usage=True)
-    processed_df = process_data(df, operation)
-    
-    # Measure end time and CPU usage
-    end_time = time.time()
-    end_cpu_times = process.cpu_times()
-    end_memory = get_avg_memory_usage()
-    end_ctx_switches = process.num_ctx_switches()
-    
-    # Calculate elapsed time and CPU usage
-    elapsed_time = end_time - start_time
-    user_cpu_time = end_cpu_times.user - start_cpu_times.user
-    system_cpu_time = end_cpu_times.system - start_cpu_times.system
-    total_cpu_time = user_cpu_time + system_cpu_time
-    cpu_usage = (total_cpu_time / elapsed_time) * 100 if elapsed_time > 0 else 0
-    
-    memory_usage_diff = end_memory - start_memory
-    peak_memory_usage_diff = peak_memory_usage - start_memory
-    voluntary_ctx_switches = end_ctx_switches.voluntary - start_ctx_switches.voluntary
-    involuntary_ctx_switches = end_ctx_switches.involuntary - start_ctx_switches.involuntary
-    
-    print("Processed Data:\n", processed_df)
-    print(f"Time Elapsed: {elapsed_time:.2f} seconds")
-    print(f"CPU Usage: {cpu_usage:.2f}%")
-    print(f"Memory Usage: {memory_usage_diff:.2f} MB")
-    print(f"Peak Memory Usage: {peak_memory_usage_diff:.2f} MB")
-    print(f"Voluntary Context Switches: {voluntary_ctx_switches}")
-    print(f"Involuntary Context Switches: {involuntary_ctx_switches}")
+    # Timing and memory are measured by the benchmark runner
+    import sys
+    import benchmark
+    benchmark.main(['--schemes', 'BFV'] + sys.argv[1:])
@@ -1,11 +1,7 @@
 import pandas as pd
 import numpy as np
 from Pyfhel import Pyfhel
-import time
-import psutil
-import numpy as np
-from memory_profiler import memory_usage
-import gc  # Import garbage collection module
+from fhe_params import plan_frame
 
 def generate_large_dataset(num_rows):
     data = {
@@ -20,92 +16,61 @@ def generate_large_dataset(num_rows):
     }
     return pd.DataFrame(data)
 
-# Setup Pyfhel context
-def setup_pyfhel():
+# Setup Pyfhel context. BGV has the same plaintext space as BFV, so the smallest secure n and
+# a batching prime t large enough for the doubled values come from the BFV planner, which
+# keeps the results comparable with BFV.py
+def setup_pyfhel(df, operation):
     HE = Pyfhel()           # Creating empty Pyfhel object
 
+    plan = plan_frame('BFV', df, operation)
     bgv_params = {
         'scheme': 'BGV',    # can also be 'bgv'
-        'n': 2**13,         # Polynomial modulus degree, the num. of slots per plaintext
-        't': 65537,         # Plaintext modulus. Encrypted operations happen modulo t
-        't_bits': 20,       # Number of bits in t. Used to generate a suitable value for t
+        'n': plan['poly_modulus_degree'],  # Polynomial modulus degree, the num. of slots per plaintext
+        't': plan['plain_modulus'],        # Plaintext modulus. Encrypted operations happen modulo t
         'sec': 128,         # Security parameter. The equivalent length of AES key in bits
     }
     HE.contextGen(**bgv_params)  # Generate context for BGV scheme
     HE.keyGen()                  # Key Generation: generates a pair of public/secret keys
-    HE.rotateKeyGen()            # Rotate key generation --> Allows rotation/shifting
+    # Element-wise operations never rotate, so no rotation keys
     HE.relinKeyGen()             # Relinearization key generation
     return HE
 
-# Encryption and decryption functions
-def encrypt_data(data, HE):
-    return HE.encryptBGV(np.array([int(data)], dtype=np.int64))
+# Encryption, computation and decryption of whole columns (timed separately by benchmark.py)
+def encrypt_column(values, HE):
+    # One packed ciphertext per n values; floats are truncated to integers
+    values = np.asarray(values).astype(np.int64)
+    return [HE.encryptBGV(values[start:start + HE.n]) for start in range(0, len(values), HE.n)]
+
+def compute_data(encrypted_value, operation):
+    # In place, so no new ciphertext is allocated per operation
+    if operation == 'addition':
+        encrypted_value += encrypted_value  # Example: doubling the value
+    elif operation == 'multiplication':
+        encrypted_value *= 2  # Example: doubling the value
+    else:
+        raise ValueError("Invalid operation")
+    return encrypted_value
 
-def decrypt_data(encrypted_data, HE):
-    return HE.decryptBGV(encrypted_data)[0]
+def decrypt_column(encrypted_column, HE, length):
+    # One decryption per ciphertext; the slots past the end of the column are padding
+    decrypted = [HE.decryptBGV(encrypted_value) for encrypted_value in encrypted_column]
+    return np.concatenate(decrypted)[:length] if decrypted else np.array([], dtype=np.int64)
 
-# Processing data sequentially
+# Processing data one packed column at a time
 def process_data(df, operation):
-    HE = setup_pyfhel()
+    HE = setup_pyfhel(df, operation)
     results = df.copy()
 
     for column in df.columns:
         if df[column].dtype in ['int64', 'float64']:
-            for i in range(len(df)):
-                encrypted_value = encrypt_data(df[column].iloc[i], HE)
-                if operation == 'addition':
-                    processed_value = encrypted_value + encrypted_value  # Example: doubling the value
-                elif operation == 'multiplication':
-                    processed_value = encrypted_value * 2  # Example: doubling the value
-                results.at[df.index[i], column] = decrypt_data(processed_value, HE)
+            encrypted_column = encrypt_column(df[column].to_numpy(), HE)
+            processed_column = [compute_data(encrypted_value, operation) for encrypted_value in encrypted_column]
+            results[column] = decrypt_column(processed_column, HE, len(df)).astype(df[column].dtype)
 
     return results
 
-def get_avg_memory_usage(interval=0.1, duration=1):
-    mem_usage = memory_usage(interval=interval, timeout=duration)
-    return np.mean(mem_usage)
-
 if __name__ == "__main__":
-    operation = 'addition'  # Example operation, can be 'multiplication' as well
-    num_rows = 6000  # Number of rows in the dataset
-    df = generate_large_dataset(num_rows)
-    
-    # Measure start time and CPU usage
-    start_time = time.time()
-    process = psutil.Process()
-    start_cpu_times = process.cpu_times()
-    start_memory = get_avg_memory_usage()
-    start_ctx_switches = process.num_ctx_switches()
-    
-    # Perform garbage collection before starting the main task to minimize fluctuations
-    gc.collect()
-    
-    # Perform processing on the dataset and measure peak memory usage
-    peak_memory_usage = memory_usage((process_data, (df, operation)), interval=0.1, max_usage=True)
-    processed_df = process_data(df, operation)
-    
-    # Measure end time and CPU usage
-    end_time = time.time()
-    end_cpu_times = process.cpu_times()
-    end_memory = get_avg_memory_usage()
-    end_ctx_switches = process.num_ctx_switches()
-    
-    # Calculate elapsed time and CPU usage
-    elapsed_time = end_time - start_time
-    user_cpu_time = end_cpu_times.user - start_cpu_times.user
-    system_cpu_time = end_cpu_times.system - start_cpu_times.system
-    total_cpu_time = user_cpu_time + system_cpu_time
-    cpu_usage = (total_cpu_time / elapsed_time) * 100 if elapsed_time > 0 else 0
-    
-    memory_usage_diff = end_memory - start_memory
-    peak_memory_usage_diff = peak_memory_usage - start_memory
-    voluntary_ctx_switches = end_ctx_switches.voluntary - start_ctx_switches.voluntary
-    involuntary_ctx_switches = end_ctx_switches.involuntary - start_ctx_switches.involuntary
-    
-    print("Processed Data:\n", processed_df)
-    print(f"Time Elapsed: {elapsed_time:.2f} seconds")
-    print(f"CPU Usage: {cpu_usage:.2f}%")
-    print(f"Memory Usage: {memory_usage_diff:.2f} MB")
-    print(f"Peak Memory Usage: {peak_memory_usage_diff:.2f} MB")
-    print(f"Voluntary Context Switches: {voluntary_ctx_switches}")
-    print(f"Involuntary Context Switches: {involuntary_ctx_switches}")
+    # Timing and memory are measured by the benchmark runner
+    import sys
+    import benchmark
+    benchmark.main(['--schemes', 'BGV'] + sys.argv[1:])
@@ -1,11 +1,11 @@
 import pandas as pd
 import numpy as np
 import tenseal as ts
+from fhe_params import plan_frame, build_context
 import time
 import multiprocessing
-import psutil
-from memory_profiler import memory_usage
-import gc  # Import garbage collection module
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import resource_tracker, shared_memory
 
 # Generate a large sample healthcare dataset
 def generate_large_dataset(num_rows):
@@ -21,16 +21,14 @@ def generate_large_dataset(num_rows):
     }
     return pd.DataFrame(data)
 
-# Setup TenSEAL context
-def setup_tenseal():
-    context = ts.context(
-        ts.SCHEME_TYPE.CKKS,
-        poly_modulus_degree=8192,
-        coeff_mod_bit_sizes=[60, 40, 40, 60]
-    )
-    context.generate_galois_keys()
-    context.global_scale = 2**40
-    return context
+# Smallest secure parameters for the data and operation
+def plan_tenseal(df, operation):
+    return plan_frame('CKKS', df, operation)
+
+# Setup TenSEAL context with the smallest secure parameters for the data and operation
+def setup_tenseal(df, operation):
+    # Element-wise operations never rotate, so no Galois keys
+    return build_context(plan_tenseal(df, operation))
 
 # Encryption and decryption functions
 def encrypt_data(data, context):
@@ -39,104 +37,281 @@ def encrypt_data(data, context):
 def decrypt_data(encrypted_data):
     return encrypted_data.decrypt()[0]
 
-# Worker function for parallel processing of sensitive columns
-def process_sensitive_data_worker(df_chunk, sensitive_columns, operation):
-    context = setup_tenseal()
-    results = df_chunk.copy()
-    
-    for column in sensitive_columns:
-        if df_chunk[column].dtype in ['int64', 'float64']:
-            for i in range(len(df_chunk)):
-                encrypted_value = encrypt_data(df_chunk[column].iloc[i], context)
-                if operation == 'addition':
-                    processed_value = encrypted_value + encrypted_value  # Example: doubling the value
-                elif operation == 'multiplication':
-                    processed_value = encrypted_value * 2  # Example: doubling the value
-                results.at[df_chunk.index[i], column] = decrypt_data(processed_value)
-    
-    return results
+# Long-lived worker pool. Every worker loads the same context once, in the pool initializer,
+# so tasks only carry (offset, length) descriptors into shared column buffers.
+_worker_context = None
+_worker_slot_count = None
+_worker_pool = None  # (parameters, context, pool)
 
-# Worker function for parallel processing of non-sensitive columns
-def process_non_sensitive_data_worker(df_chunk, non_sensitive_columns, operation):
-    results = df_chunk.copy()
-    
-    for column in non_sensitive_columns:
-        if df_chunk[column].dtype in ['int64', 'float64']:
-            if operation == 'addition':
-                results[column] = df_chunk[column] + df_chunk[column]  # Example: doubling the value
-            elif operation == 'multiplication':
-                results[column] = df_chunk[column] * 2  # Example: doubling the value
-    
-    return results
+# Thread engine: one context (and one copy of the keys) shared by a pool of threads.
+# TenSEAL's own thread pool is sized to match through the context's n_threads.
+_thread_pool = None  # (parameters, context, executor)
+ENGINES = ('process', 'thread')
 
-# Main processing function
-def process_data_parallel(df, sensitive_columns, operation):
-    non_sensitive_columns = [col for col in df.columns if col not in sensitive_columns]
+# Scheduling: a task is a range of whole ciphertexts of one column, sized to run for about
+# TARGET_TASK_DURATION seconds, but there are at least TASKS_PER_WORKER of them per worker so
+# a slow task does not leave the others idle, down to one ciphertext per task. The columns x
+# ciphertexts give enough tasks to keep many cores busy on moderate frames.
+TARGET_TASK_DURATION = 0.1
+TASKS_PER_WORKER = 4
+_ciphertext_seconds = {}  # measured seconds per ciphertext, per (parameters, engine, operation)
 
-    num_chunks = multiprocessing.cpu_count()  # Number of chunks based on CPU cores
-    chunk_size = len(df) // num_chunks
-    chunks = [df.iloc[i:i + chunk_size] for i in range(0, len(df), chunk_size)]
-    
-    with multiprocessing.Pool(processes=num_chunks) as pool:
-        sensitive_results = pool.starmap(process_sensitive_data_worker, [(chunk[sensitive_columns], sensitive_columns, operation) for chunk in chunks])
-        non_sensitive_results = pool.starmap(process_non_sensitive_data_worker, [(chunk[non_sensitive_columns], non_sensitive_columns, operation) for chunk in chunks])
-    
-    sensitive_df = pd.concat(sensitive_results, ignore_index=True)
-    non_sensitive_df = pd.concat(non_sensitive_results, ignore_index=True)
-    
-    processed_df = pd.concat([non_sensitive_df, sensitive_df], axis=1).sort_index(axis=1)
-    
-    return processed_df
+def init_worker(serialized_context, slot_count):
+    global _worker_context, _worker_slot_count
+    _worker_context = ts.context_from(serialized_context)
+    _worker_slot_count = slot_count
 
-def get_avg_memory_usage(interval=0.1, duration=1):
-    mem_usage = memory_usage(interval=interval, timeout=duration)
-    return np.mean(mem_usage)
+def get_worker_pool(plan, processes=None):
+    """Return (context, pool) for the parameters, reusing the pool while they do not change."""
+    global _worker_pool
+    processes = processes or multiprocessing.cpu_count()
+    key = (plan['poly_modulus_degree'], tuple(plan['coeff_mod_bit_sizes']), plan['global_scale'], processes)
+    if _worker_pool is not None and _worker_pool[0] == key:
+        return _worker_pool[1], _worker_pool[2]
 
-if __name__ == "__main__":
-    num_rows = 6000  # Number of rows in the dataset
-    df = generate_large_dataset(num_rows)
-    sensitive_columns = ['age', 'patient_id', 'height', 'weight']  # Specify sensitive columns here
-    operation = 'addition'  # Example operation, can be 'multiplication' as well
-    
-    # Measure start time and CPU usage
-    start_time = time.time()
-    process = psutil.Process()
-    start_cpu_times = process.cpu_times()
-    start_memory = get_avg_memory_usage()
-    start_ctx_switches = process.num_ctx_switches()
-
-    # Perform garbage collection before starting the main task to minimize fluctuations
-    gc.collect()
-
-    # Perform parallel processing on the dataset and measure peak memory usage
-    peak_memory_usage = memory_usage((process_data_parallel, (df, sensitive_columns, operation)), interval=0.1, max_usage=True)
-    processed_df = process_data_parallel(df, sensitive_columns, operation)
-    
-    # Measure end time and CPU usage
-    end_time = time.time()
-    end_cpu_times = process.cpu_times()
-    end_memory = get_avg_memory_usage()
-    end_ctx_switches = process.num_ctx_switches()
-    
-    # Calculate elapsed time and CPU usage
-    elapsed_time = end_time - start_time
-    user_cpu_time = end_cpu_times.user - start_cpu_times.user
-    system_cpu_time = end_cpu_times.system - start_cpu_times.system
-    total_cpu_time = user_cpu_time + system_cpu_time
-    cpu_usage = (total_cpu_time / elapsed_time) * 100 if elapsed_time > 0 else 0
-    
-    memory_usage_diff = start_memory - end_memory
-    peak_memory_usage_diff = peak_memory_usage - end_memory
-    voluntary_ctx_switches = end_ctx_switches.voluntary - start_ctx_switches.voluntary
-    involuntary_ctx_switches = end_ctx_switches.involuntary - start_ctx_switches.involuntary
-    
-    print("Processed Data:\n", processed_df)
-    print(f"Time Elapsed: {elapsed_time:.2f} seconds")
-    print(f"CPU Usage: {cpu_usage:.2f}%")
-    print(f"Memory Usage: {memory_usage_diff:.2f} MB")
-    print(f"Peak Memory Usage: {peak_memory_usage_diff:.2f} MB")
-    print(f"Voluntary Context Switches: {voluntary_ctx_switches}")
-    print(f"Involuntary Context Switches: {involuntary_ctx_switches}")
+    shutdown_worker_pool()
+    context = build_context(plan)
+    # Forked workers must share the parent's resource tracker, or each starts its own and
+    # reports the shared segments the parent unlinks as leaked
+    resource_tracker.ensure_running()
+    # Workers decrypt their results straight into the shared output, so they get the secret key
+    pool = multiprocessing.Pool(
+        processes=processes,
+        initializer=init_worker,
+        initargs=(context.serialize(save_secret_key=True), plan['slot_count'])
+    )
+    _worker_pool = (key, context, pool)
+    return context, pool
+
+def get_thread_pool(plan, threads=None):
+    """Return (context, executor) for the parameters, reusing the threads while they do not change."""
+    global _thread_pool
+    threads = threads or multiprocessing.cpu_count()
+    key = (plan['poly_modulus_degree'], tuple(plan['coeff_mod_bit_sizes']), plan['global_scale'], threads)
+    if _thread_pool is not None and _thread_pool[0] == key:
+        return _thread_pool[1], _thread_pool[2]
+
+    shutdown_thread_pool()
+    context = build_context(plan, n_threads=threads)
+    _thread_pool = (key, context, ThreadPoolExecutor(max_workers=threads))
+    return _thread_pool[1], _thread_pool[2]
+
+def shutdown_thread_pool():
+    global _thread_pool
+    if _thread_pool is not None:
+        _thread_pool[2].shutdown()
+        _thread_pool = None
+
+def shutdown_worker_pool():
+    """Stop the worker processes and threads of both engines."""
+    global _worker_pool
+    if _worker_pool is not None:
+        _worker_pool[2].close()
+        _worker_pool[2].join()
+        _worker_pool = None
+    shutdown_thread_pool()
 
+def reset_state():
+    """Back to a cold start: no worker pools, contexts or ciphertext timings kept from earlier calls."""
+    shutdown_worker_pool()
+    _ciphertext_seconds.clear()
 
+# Shared column buffers: one row of a float64 array per numeric column, so a chunk of a
+# column is a contiguous slice
+def create_shared_array(shape):
+    shm = shared_memory.SharedMemory(create=True, size=max(shape[0] * shape[1] * 8, 1))
+    return shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
 
+def attach_shared_array(name, shape):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+def compute_ciphertext(encrypted_value, operation):
+    if operation == 'addition':
+        return encrypted_value + encrypted_value  # Example: doubling the value
+    elif operation == 'multiplication':
+        return encrypted_value * 2  # Example: doubling the value
+    raise ValueError("Invalid operation")
+
+# Encrypt, process and decrypt one ciphertext's worth of values
+def process_ciphertext(context, values, operation):
+    return compute_ciphertext(ts.ckks_vector(context, values), operation).decrypt()
+
+def measure_ciphertext_seconds(context, slot_count, operation, key):
+    """Seconds to encrypt, process and decrypt one full ciphertext, measured once per parameters."""
+    if (key, operation) not in _ciphertext_seconds:
+        sample = np.zeros(slot_count)
+        process_ciphertext(context, sample, operation)  # warm-up
+        start = time.perf_counter()
+        process_ciphertext(context, sample, operation)
+        _ciphertext_seconds[(key, operation)] = time.perf_counter() - start
+    return _ciphertext_seconds[(key, operation)]
+
+def plan_tasks(num_rows, slot_count, ciphertext_seconds, num_sensitive, processes, target_task_duration):
+    """(column, offset, length) tasks of about target_task_duration seconds each.
+
+    Every task covers whole ciphertexts of one column, so only the last task of a column
+    encrypts a partly empty one.
+    """
+    chunks = -(-num_rows // slot_count)
+    total = num_sensitive * chunks
+    if total == 0:
+        return []
+    ciphertexts = max(int(target_task_duration / ciphertext_seconds), 1)
+    # Never fewer than TASKS_PER_WORKER tasks per worker while there are ciphertexts to split
+    ciphertexts = max(min(ciphertexts, -(-total // (processes * TASKS_PER_WORKER))), 1)
+    task_rows = ciphertexts * slot_count
+    return [
+        (column, offset, min(task_rows, num_rows - offset))
+        for column in range(num_sensitive)
+        for offset in range(0, num_rows, task_rows)
+    ]
+
+# Process rows offset to offset + length of one column; returns the number of ciphertexts
+# and the seconds spent encrypting, computing and decrypting
+def process_rows(context, slot_count, values, results, column, offset, length, operation):
+    ciphertexts = 0
+    phase_seconds = [0.0, 0.0, 0.0]
+    stop = offset + length
+    # One ciphertext holds up to slot_count values of the column
+    for start in range(offset, stop, slot_count):
+        end = min(start + slot_count, stop)
+        t0 = time.perf_counter()
+        encrypted_value = ts.ckks_vector(context, values[column, start:end])
+        t1 = time.perf_counter()
+        processed_value = compute_ciphertext(encrypted_value, operation)
+        t2 = time.perf_counter()
+        results[column, start:end] = processed_value.decrypt()
+        t3 = time.perf_counter()
+        phase_seconds[0] += t1 - t0
+        phase_seconds[1] += t2 - t1
+        phase_seconds[2] += t3 - t2
+        ciphertexts += 1
+    return ciphertexts, phase_seconds
+
+# Worker function for parallel processing of one chunk of a column; returns
+# (ciphertexts, seconds, phase seconds)
+def process_chunk_worker(task):
+    input_name, output_name, shape, column, offset, length, operation = task
+    start_time = time.perf_counter()
+    input_shm, values = attach_shared_array(input_name, shape)
+    output_shm, results = attach_shared_array(output_name, shape)
+    try:
+        ciphertexts, phase_seconds = process_rows(
+            _worker_context, _worker_slot_count, values, results, column, offset, length, operation
+        )
+    finally:
+        # The views have to go before the segments can be closed
+        del values, results
+        input_shm.close()
+        output_shm.close()
+    return ciphertexts, time.perf_counter() - start_time, phase_seconds
+
+# Thread engine counterpart: the threads share the parent's arrays and context directly
+def process_chunk_thread(context, slot_count, values, results, column, offset, length, operation):
+    start_time = time.perf_counter()
+    ciphertexts, phase_seconds = process_rows(
+        context, slot_count, values, results, column, offset, length, operation
+    )
+    return ciphertexts, time.perf_counter() - start_time, phase_seconds
+
+# Plain columns need no pool: one vectorized operation per column, keeping its dtype
+def process_plain_column(values, operation):
+    if operation == 'addition':
+        return values + values  # Example: doubling the value
+    elif operation == 'multiplication':
+        return values * 2  # Example: doubling the value
+    raise ValueError("Invalid operation")
+
+# Main processing function. engine is 'process' (worker processes over shared memory) or
+# 'thread' (threads sharing one context); workers is the number of processes or threads.
+# phase_times, when given, accumulates the seconds of the keygen (context and pool set-up),
+# encrypt, compute and decrypt phases; the last three are summed over all workers.
+def process_data_parallel(df, sensitive_columns, operation, workers=None,
+                          target_task_duration=TARGET_TASK_DURATION, engine='process', phase_times=None):
+    if engine not in ENGINES:
+        raise ValueError("Invalid engine, use either 'process' or 'thread'")
+    numeric_columns = [col for col in df.columns if df[col].dtype in ['int64', 'float64']]
+    encrypted_columns = [col for col in numeric_columns if col in sensitive_columns]
+    plain_columns = [col for col in numeric_columns if col not in sensitive_columns]
+    processed_df = df.copy() if len(numeric_columns) < len(df.columns) else pd.DataFrame(index=df.index)
+
+    if not encrypted_columns:
+        for col in plain_columns:
+            processed_df[col] = process_plain_column(df[col], operation)
+        return processed_df.reset_index(drop=True).sort_index(axis=1)
+
+    workers = workers or multiprocessing.cpu_count()
+    setup_start = time.perf_counter()
+
+    # One context for the whole frame; the pool is kept for the next call with the same parameters
+    plan = plan_tenseal(df[sensitive_columns], operation)
+    if engine == 'process':
+        context, pool = get_worker_pool(plan, workers)
+    else:
+        context, executor = get_thread_pool(plan, workers)
+    key = (plan['poly_modulus_degree'], tuple(plan['coeff_mod_bit_sizes']), plan['global_scale'], engine)
+    ciphertext_seconds = measure_ciphertext_seconds(context, plan['slot_count'], operation, key)
+    if phase_times is not None:
+        phase_times['keygen'] = phase_times.get('keygen', 0.0) + time.perf_counter() - setup_start
+    ranges = plan_tasks(len(df), plan['slot_count'], ciphertext_seconds,
+                        len(encrypted_columns), workers, target_task_duration)
+
+    # Sensitive columns are copied once, into shared memory for the processes; tasks only
+    # name a column and a range of rows
+    shape = (len(encrypted_columns), len(df))
+    if engine == 'process':
+        input_shm, values = create_shared_array(shape)
+        output_shm, results = create_shared_array(shape)
+    else:
+        input_shm = output_shm = None
+        values, results = np.empty(shape), np.empty(shape)
+    try:
+        for i, col in enumerate(encrypted_columns):
+            values[i] = df[col].to_numpy(dtype=float)
+        # Idle workers take the next task as soon as they finish; every task writes its own
+        # rows of the output, so completion order does not matter. Both pools run the tasks
+        # in the background, so the plain columns are done meanwhile.
+        if engine == 'process':
+            completed = pool.imap_unordered(process_chunk_worker, [
+                (input_shm.name, output_shm.name, shape, column, offset, length, operation)
+                for column, offset, length in ranges
+            ])
+        else:
+            futures = [
+                executor.submit(process_chunk_thread, context, plan['slot_count'], values, results,
+                                column, offset, length, operation)
+                for column, offset, length in ranges
+            ]
+            completed = (future.result() for future in as_completed(futures))
+        for col in plain_columns:
+            processed_df[col] = process_plain_column(df[col], operation)
+
+        total_ciphertexts, total_seconds = 0, 0.0
+        for ciphertexts, seconds, phase_seconds in completed:
+            total_ciphertexts += ciphertexts
+            total_seconds += seconds
+            if phase_times is not None:
+                for phase, seconds_in_phase in zip(('encrypt', 'compute', 'decrypt'), phase_seconds):
+                    phase_times[phase] = phase_times.get(phase, 0.0) + seconds_in_phase
+        if total_ciphertexts:
+            # The next call sizes its tasks from what the workers actually took
+            _ciphertext_seconds[(key, operation)] = total_seconds / total_ciphertexts
+
+        for i, col in enumerate(encrypted_columns):
+            processed_df[col] = results[i].copy()
+    finally:
+        del values, results
+        if input_shm is not None:
+            input_shm.close()
+            input_shm.unlink()
+            output_shm.close()
+            output_shm.unlink()
+    
+    return processed_df.reset_index(drop=True).sort_index(axis=1)
+
+if __name__ == "__main__":
+    # Timing and memory are measured by the benchmark runner, with both engines
+    import sys
+    import benchmark
+    benchmark.main(['--schemes', 'FHE', 'FHE-thread'] + sys.argv[1:])
@@ -0,0 +1,119 @@
+"""Execution backends for framework.process_data.
+
+"http" calls the deployed Lambdas through API Gateway, "local" calls both handlers in this
+process and "process" runs them in a process pool. The last two take the network out, so
+the whole request path can be profiled on a laptop or CI box.
+"""
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Endpoints and timeouts can point at local stand-ins (see local_lambda.py) for offline runs
+NON_SENSITIVE_URL = os.environ.get(
+    'NON_SENSITIVE_URL', 'https://d1ci2kx43g.execute-api.eu-west-1.amazonaws.com/non_sensitive/'
+)
+SENSITIVE_URL = os.environ.get(
+    'SENSITIVE_URL', 'https://1gjf7bj3f0.execute-api.eu-west-1.amazonaws.com/sensitive/'
+)
+# (connect, read) seconds; the sensitive Lambda can take a while on large frames
+REQUEST_TIMEOUT = (
+    float(os.environ.get('LAMBDA_CONNECT_TIMEOUT', 5)),
+    float(os.environ.get('LAMBDA_READ_TIMEOUT', 120))
+)
+REQUEST_RETRIES = int(os.environ.get('LAMBDA_RETRIES', 2))
+DEFAULT_BACKEND = os.environ.get('FHE_BACKEND', 'http')
+
+def create_session(retries=REQUEST_RETRIES, backoff_factor=0.5, pool_maxsize=10):
+    """A requests.Session with keep-alive connection pooling and retries on throttling and 5xx."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['POST'])  # both handlers are stateless, so POST is safe to repeat
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def load_handler(endpoint):
+    """The lambda_handler of 'non_sensitive' or 'sensitive', imported on first use."""
+    if endpoint == 'non_sensitive':
+        import non_sensitive
+        return non_sensitive.lambda_handler
+    elif endpoint == 'sensitive':
+        # sensitive.py lives in sensitive/; appended so the client's own tenseal stays in use
+        sensitive_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sensitive')
+        if sensitive_dir not in sys.path:
+            sys.path.append(sensitive_dir)
+        import sensitive
+        return sensitive.lambda_handler
+    raise ValueError("Unknown endpoint: %s" % endpoint)
+
+def invoke_serialized(endpoint, request_json):
+    # Runs in the worker processes of ProcessBackend
+    return json.dumps(load_handler(endpoint)(json.loads(request_json), None))
+
+class HttpBackend:
+    """The deployed Lambdas behind API Gateway, over one pooled session."""
+
+    def __init__(self, non_sensitive_url=None, sensitive_url=None, session=None, timeout=REQUEST_TIMEOUT):
+        self.urls = {
+            'non_sensitive': non_sensitive_url or NON_SENSITIVE_URL,
+            'sensitive': sensitive_url or SENSITIVE_URL
+        }
+        self.session = session or create_session()
+        self.timeout = timeout
+
+    def invoke(self, endpoint, request):
+        response = self.session.post(self.urls[endpoint], json=request, timeout=self.timeout)
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        return response.json()
+
+class LocalBackend:
+    """Both handlers called in this process.
+
+    With serialize=True requests and responses still go through JSON, so the cost matches
+    the HTTP path minus the network.
+    """
+
+    def __init__(self, serialize=True):
+        self.serialize = serialize
+
+    def invoke(self, endpoint, request):
+        handler = load_handler(endpoint)
+        if not self.serialize:
+            return handler(request, None)
+        return json.loads(invoke_serialized(endpoint, json.dumps(request)))
+
+class ProcessBackend:
+    """Both handlers run in a pool of worker processes, which stay warm like Lambda instances."""
+
+    def __init__(self, max_workers=None):
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    def invoke(self, endpoint, request):
+        return json.loads(self.executor.submit(invoke_serialized, endpoint, json.dumps(request)).result())
+
+    def close(self):
+        self.executor.shutdown()
+
+BACKENDS = {'http': HttpBackend, 'local': LocalBackend, 'process': ProcessBackend}
+_default_backends = {}
+
+def get_backend(backend=None):
+    """Resolve a backend instance or name ('http', 'local', 'process'); names share one instance."""
+    if backend is not None and not isinstance(backend, str):
+        return backend
+    name = backend or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError("Unknown backend: %s" % name)
+    # Reusing the instance keeps HTTP connections and worker processes warm
+    if name not in _default_backends:
+        _default_backends[name] = BACKENDS[name]()
+    return _default_backends[name]
@@ -0,0 +1,250 @@
+"""Benchmark runner for the case studies (CKKS.py, BFV.py, BGV.py and FHE.py).
+
+Every configuration (scheme, operation, row count) is run `repeats` times, one run per
+measurement. Each run reports the seconds spent in the keygen, encrypt, compute and decrypt
+phases, the wall time and the peak memory. The results are written as JSON with the mean,
+standard deviation and 95% confidence interval of every measurement.
+
+    python benchmark.py --rows 100 1000 --schemes CKKS BFV FHE --repeats 5 --output results.json
+"""
+import argparse
+import gc
+import importlib
+import json
+import math
+import multiprocessing
+import platform
+import statistics
+import sys
+import time
+import numpy as np
+import psutil
+from memory_profiler import memory_usage
+
+# Case studies run in this process: scheme -> (module, context set-up function)
+CASE_STUDIES = {
+    'CKKS': ('CKKS', 'setup_tenseal'),
+    'BFV': ('BFV', 'setup_tenseal'),
+    'BGV': ('BGV', 'setup_pyfhel'),
+}
+# FHE.process_data_parallel, per execution engine
+PARALLEL_ENGINES = {'FHE': 'process', 'FHE-thread': 'thread'}
+SCHEMES = tuple(CASE_STUDIES) + tuple(PARALLEL_ENGINES)
+OPERATIONS = ('addition', 'multiplication')
+PHASES = ('keygen', 'encrypt', 'compute', 'decrypt')
+
+# Two-sided 95% Student t quantiles by degrees of freedom; larger samples use the nearest
+# smaller entry, which keeps the interval on the safe side
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306,
+        9: 2.262, 10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 30: 2.042, 60: 2.000, 120: 1.980}
+
+def summarize(samples):
+    """Mean, standard deviation and 95% confidence interval of the mean of a list of samples."""
+    mean = statistics.fmean(samples)
+    if len(samples) < 2:
+        return {'mean': mean, 'stdev': None, 'ci95': None, 'samples': samples}
+    stdev = statistics.stdev(samples)
+    degrees = len(samples) - 1
+    t = T_95[max(k for k in T_95 if k <= degrees)] if degrees <= 120 else 1.960
+    margin = t * stdev / math.sqrt(len(samples))
+    return {'mean': mean, 'stdev': stdev, 'ci95': [mean - margin, mean + margin], 'samples': samples}
+
+def numeric_columns(df):
+    return [column for column in df.columns if df[column].dtype in ['int64', 'float64']]
+
+def run_case_study(module, setup, df, operation):
+    """One run of a case study; returns (processed columns, {phase: seconds}).
+
+    Modules with encrypt_column/decrypt_column (batched) process a column per phase, the
+    others one value at a time.
+    """
+    phase_times = dict.fromkeys(PHASES, 0.0)
+    start = time.perf_counter()
+    context = setup(df, operation)
+    phase_times['keygen'] = time.perf_counter() - start
+
+    processed = {}
+    for column in numeric_columns(df):
+        if hasattr(module, 'encrypt_column'):
+            t0 = time.perf_counter()
+            encrypted_column = module.encrypt_column(df[column].to_numpy(), context)
+            t1 = time.perf_counter()
+            processed_column = [module.compute_data(encrypted_value, operation) for encrypted_value in encrypted_column]
+            t2 = time.perf_counter()
+            processed[column] = module.decrypt_column(processed_column, context, len(df))
+            t3 = time.perf_counter()
+            phase_times['encrypt'] += t1 - t0
+            phase_times['compute'] += t2 - t1
+            phase_times['decrypt'] += t3 - t2
+            continue
+        values = []
+        for value in df[column]:
+            t0 = time.perf_counter()
+            encrypted_value = module.encrypt_data(value, context)
+            t1 = time.perf_counter()
+            processed_value = module.compute_data(encrypted_value, operation)
+            t2 = time.perf_counter()
+            values.append(module.decrypt_data(processed_value, context))
+            t3 = time.perf_counter()
+            phase_times['encrypt'] += t1 - t0
+            phase_times['compute'] += t2 - t1
+            phase_times['decrypt'] += t3 - t2
+        processed[column] = values
+    return processed, phase_times
+
+def run_parallel(module, engine, df, operation, sensitive_columns, workers):
+    """One run of FHE.process_data_parallel; the phases are summed over the workers."""
+    phase_times = dict.fromkeys(PHASES, 0.0)
+    results = module.process_data_parallel(
+        df, sensitive_columns, operation, workers, engine=engine, phase_times=phase_times
+    )
+    return {column: results[column] for column in numeric_columns(df)}, phase_times
+
+def measure(run, df):
+    """Run once, sampling memory alongside; returns one measurement."""
+    gc.collect()
+    process = psutil.Process()
+    baseline_mb = process.memory_info().rss / 2 ** 20
+    start_cpu = process.cpu_times()
+    start = time.perf_counter()
+    peak_mb, (processed, phase_times) = memory_usage(
+        run, interval=0.05, max_usage=True, retval=True, include_children=True
+    )
+    wall_seconds = time.perf_counter() - start
+    end_cpu = process.cpu_times()
+
+    # Both operations double the values
+    max_error = max(
+        (float(np.max(np.abs(np.asarray(values, dtype=float) - 2 * df[column].to_numpy(dtype=float))))
+         for column, values in processed.items() if len(values)),
+        default=0.0
+    )
+    return {
+        'phases': phase_times,
+        'wall_seconds': wall_seconds,
+        'cpu_seconds': (end_cpu.user - start_cpu.user) + (end_cpu.system - start_cpu.system),
+        'peak_memory_mb': peak_mb - baseline_mb,
+        'max_error': max_error,
+    }
+
+def benchmark_configuration(scheme, operation, rows, repeats=3, warmup=0, seed=0,
+                            sensitive_columns=None, workers=None):
+    """Summary of `repeats` measured runs (after `warmup` unmeasured ones) of one configuration.
+
+    Every measured run includes the set-up of its context (and of FHE.py's worker pool).
+    """
+    if scheme in CASE_STUDIES:
+        module_name, setup_name = CASE_STUDIES[scheme]
+    elif scheme in PARALLEL_ENGINES:
+        module_name = 'FHE'
+    else:
+        raise ValueError("Unknown scheme: %s" % scheme)
+    module = importlib.import_module(module_name)
+
+    # Every scheme sees the same data for a given seed and row count
+    np.random.seed(seed)
+    df = module.generate_large_dataset(rows)
+    if scheme in CASE_STUDIES:
+        setup = getattr(module, setup_name)
+        run = (run_case_study, (module, setup, df, operation))
+    else:
+        # By default every numeric column is encrypted, like the per-value case studies
+        columns = sensitive_columns or numeric_columns(df)
+        run = (run_parallel, (module, PARALLEL_ENGINES[scheme], df, operation, columns, workers))
+
+    for _ in range(warmup):
+        run[0](*run[1])
+    measurements = []
+    for _ in range(repeats):
+        # FHE.py keeps its pools, context and ciphertext timings between calls; every
+        # measured run starts cold, like the case studies that set up their context per run
+        if scheme in PARALLEL_ENGINES:
+            module.reset_state()
+        measurements.append(measure(run, df))
+
+    return {
+        'scheme': scheme,
+        'operation': operation,
+        'rows': rows,
+        'repeats': repeats,
+        'phases': {phase: summarize([m['phases'][phase] for m in measurements]) for phase in PHASES},
+        'wall_seconds': summarize([m['wall_seconds'] for m in measurements]),
+        'cpu_seconds': summarize([m['cpu_seconds'] for m in measurements]),
+        'peak_memory_mb': summarize([m['peak_memory_mb'] for m in measurements]),
+        'max_error': max(m['max_error'] for m in measurements),
+    }
+
+def environment():
+    import tenseal
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'tenseal': getattr(tenseal, '__version__', None),
+    }
+
+def run_benchmarks(schemes=SCHEMES, operations=OPERATIONS, rows=(1000,), repeats=3, warmup=0, seed=0,
+                   sensitive_columns=None, workers=None):
+    """Benchmark every combination of scheme, operation and row count.
+
+    A scheme whose module cannot be imported (BGV without Pyfhel) is recorded with the error
+    instead of stopping the sweep.
+    """
+    results = []
+    for scheme in schemes:
+        for operation in operations:
+            for row_count in rows:
+                try:
+                    result = benchmark_configuration(
+                        scheme, operation, row_count, repeats, warmup, seed, sensitive_columns, workers
+                    )
+                except ImportError as e:
+                    result = {'scheme': scheme, 'operation': operation, 'rows': row_count, 'error': str(e)}
+                results.append(result)
+                print_result(result)
+        if scheme in PARALLEL_ENGINES:
+            # So that the next scheme's memory does not include this engine's workers
+            importlib.import_module('FHE').shutdown_worker_pool()
+    return {
+        'environment': environment(),
+        'config': {
+            'schemes': list(schemes), 'operations': list(operations), 'rows': list(rows),
+            'repeats': repeats, 'warmup': warmup, 'seed': seed,
+            'sensitive_columns': sensitive_columns, 'workers': workers,
+        },
+        'results': results,
+    }
+
+def print_result(result):
+    label = "%s %s %d rows" % (result['scheme'], result['operation'], result['rows'])
+    if 'error' in result:
+        print("%s: skipped (%s)" % (label, result['error']))
+        return
+    phases = ", ".join("%s %.3fs" % (phase, result['phases'][phase]['mean']) for phase in PHASES)
+    print("%s: %.3fs wall (%s), peak %.1f MB, max error %.3g" % (
+        label, result['wall_seconds']['mean'], phases, result['peak_memory_mb']['mean'], result['max_error']
+    ))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the FHE case studies.")
+    parser.add_argument('--schemes', nargs='+', choices=SCHEMES, default=list(SCHEMES))
+    parser.add_argument('--operations', nargs='+', choices=OPERATIONS, default=list(OPERATIONS))
+    parser.add_argument('--rows', nargs='+', type=int, default=[1000])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=0, help="unmeasured runs before the measured ones")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sensitive-columns', nargs='+', help="columns FHE.py encrypts (default: all numeric)")
+    parser.add_argument('--workers', type=int, help="processes or threads for FHE.py (default: all cores)")
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        args.schemes, args.operations, args.rows, args.repeats, args.warmup, args.seed,
+        args.sensitive_columns, args.workers
+    )
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Results written to %s" % args.output)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
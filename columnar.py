@@ -0,0 +1,92 @@
+"""Columnar wire format for the DataFrames exchanged between framework.py and both Lambdas.
+
+Every column travels as one little-endian numpy buffer together with its dtype, so
+integers stay integers and no per-row Python lists are built on either end.
+package_lambdas.py adds this file to both Lambda packages.
+"""
+import base64
+import zlib
+import numpy as np
+import pandas as pd
+
+FORMAT = 'columnar-v1'
+COMPRESSIONS = (None, 'zlib')
+
+def is_columnar(payload):
+    return isinstance(payload, dict) and payload.get('format') == FORMAT
+
+def narrowest_int_dtype(values):
+    # Small integers (ages, ids, readings) travel in 1 or 2 bytes instead of 8
+    if len(values) == 0:
+        return values.dtype
+    low, high = values.min(), values.max()
+    for candidate in ('<u1', '<u2', '<u4') if low >= 0 else ('<i1', '<i2', '<i4'):
+        info = np.iinfo(candidate)
+        if info.min <= low and high <= info.max:
+            return np.dtype(candidate)
+    return values.dtype
+
+def encode_column(values, compression=None):
+    # Fixed-width numbers go as raw buffers, anything else (strings) as plain JSON values
+    if values.dtype.kind not in 'biuf':
+        return {'dtype': 'object', 'values': values.tolist()}
+    dtype = values.dtype.newbyteorder('<')
+    column = {'dtype': dtype.str}
+    wire_dtype = narrowest_int_dtype(values).newbyteorder('<') if dtype.kind in 'iu' else dtype
+    if wire_dtype != dtype:
+        column['wire_dtype'] = wire_dtype.str
+    raw = values.astype(wire_dtype, copy=False).tobytes()
+    if compression == 'zlib':
+        raw = zlib.compress(raw)
+    column['data'] = base64.b64encode(raw).decode('ascii')
+    return column
+
+def decode_column(column, compression=None):
+    if column['dtype'] == 'object':
+        return np.array(column['values'], dtype=object)
+    raw = base64.b64decode(column['data'])
+    if compression == 'zlib':
+        raw = zlib.decompress(raw)
+    values = np.frombuffer(raw, dtype=np.dtype(column.get('wire_dtype', column['dtype'])))
+    return values.astype(np.dtype(column['dtype']), copy=False)
+
+def encode_columns(columns, length, compression=None):
+    """Encode {name: numpy array} columns of `length` values as a JSON-safe dict."""
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unsupported compression: %s" % compression)
+    encoded = []
+    for name, values in columns.items():
+        column = encode_column(np.asarray(values), compression)
+        column['name'] = name
+        encoded.append(column)
+    return {'format': FORMAT, 'length': length, 'compression': compression, 'columns': encoded}
+
+def encode_frame(df, compression=None):
+    """Encode a DataFrame as a JSON-safe dict; compression is None or 'zlib'."""
+    return encode_columns({name: df[name].to_numpy() for name in df.columns}, len(df), compression)
+
+def decode_columns(payload):
+    """The columns of an encoded payload as {name: numpy array}, checking that every column has `length` values.
+
+    Numeric arrays are read-only views of the decoded buffers.
+    """
+    if not is_columnar(payload):
+        raise ValueError("Invalid data format")
+    compression = payload.get('compression')
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unsupported compression: %s" % compression)
+
+    length = payload['length']
+    columns = {}
+    for column in payload['columns']:
+        values = decode_column(column, compression)
+        if len(values) != length:
+            raise ValueError("Mismatch between number of rows and length of column '%s'" % column['name'])
+        columns[column['name']] = values
+    return columns
+
+def decode_frame(payload):
+    """Rebuild the DataFrame of encode_frame."""
+    columns = decode_columns(payload)
+    # The dict constructor copies, so the frame does not share the read-only buffers
+    return pd.DataFrame(columns, columns=list(columns), index=pd.RangeIndex(payload['length']))
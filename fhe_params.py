@@ -0,0 +1,191 @@
+"""Pick the smallest secure encryption parameters for a workload instead of hard-coding
+poly_modulus_degree 8192. Shared by the case study scripts and the sensitive Lambda
+(packaged into sensitive.zip by package_lambdas.py).
+"""
+import math
+import numpy as np
+import tenseal as ts
+
+# Largest total coeff_modulus bit count per poly_modulus_degree at 128-bit security (SEAL).
+# 2048 is left out: it only fits a single prime, so there is no key switching.
+MAX_COEFF_MODULUS_BITS = {4096: 109, 8192: 218, 16384: 438, 32768: 881}
+
+# Multiplicative depth of the element-wise case study operations
+OPERATION_DEPTH = {'addition': 0, 'multiplication': 1}
+
+# Extra scale bits on top of the measured noise: the error of single slots spreads a few
+# bits beyond the typical values the noise model is fitted to
+NOISE_MARGIN_BITS = 4
+
+def is_prime(n):
+    # Deterministic Miller-Rabin for n < 2**64
+    if n < 2:
+        return False
+    bases = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+    for p in bases:
+        if n % p == 0:
+            return n == p
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d, r = d // 2, r + 1
+    for a in bases:
+        x = pow(a, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(r - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+def batching_prime(bits, poly_modulus_degree):
+    """Smallest prime of at least `bits` bits that is 1 mod 2 * poly_modulus_degree (needed for BFV batching)."""
+    step = 2 * poly_modulus_degree
+    t = ((1 << (bits - 1)) // step + 1) * step + 1
+    while not is_prime(t):
+        t += step
+    return t
+
+def ckks_primes(bits, count, poly_modulus_degree):
+    """The `count` largest primes below 2**bits that are 1 mod 2 * poly_modulus_degree, as
+    SEAL picks them for `count` entries of `bits` bits in coeff_mod_bit_sizes."""
+    step = 2 * poly_modulus_degree
+    primes = []
+    q = (1 << bits) - step + 1
+    while len(primes) < count:
+        if is_prime(q):
+            primes.append(q)
+        q -= step
+    return primes
+
+def ckks_scale(scale_bits, depth, poly_modulus_degree):
+    """global_scale for `depth` rescaling primes of scale_bits bits.
+
+    TenSEAL sets the scale back to global_scale after every rescale, while the ciphertext
+    was divided by a prime somewhat below 2**scale_bits: with a power of two scale every
+    level multiplies the values by prime / 2**scale_bits, about 2**-20 at 38 bits. The
+    geometric mean of the primes cancels that out over the levels.
+    """
+    if not depth:
+        return 2 ** scale_bits
+    return math.prod(ckks_primes(scale_bits, depth, poly_modulus_degree)) ** (1 / depth)
+
+def plan_ckks(max_abs_value, rows=1, depth=0, precision_bits=20):
+    int_bits = math.ceil(math.log2(max_abs_value * rows + 1)) + 1
+    for degree, max_bits in sorted(MAX_COEFF_MODULUS_BITS.items()):
+        # Measured CKKS error on fully packed vectors: about N after encryption, about
+        # N * 2**16 after the first rescale, and it adds up over the slots of a sum
+        noise_bits = int(math.log2(degree)) + (16 + depth if depth else 1)
+        noise_bits += math.ceil(math.log2(min(rows, degree // 2)))
+        # Keep precision_bits significant bits of the largest intermediate value, as far
+        # as 60-bit primes allow
+        scale_bits = min(max(noise_bits + precision_bits - int_bits + NOISE_MARGIN_BITS, 20), 60 - int_bits)
+        if scale_bits < 20:
+            break
+        # The special prime must be at least as large as the largest data prime
+        first_bits = scale_bits + int_bits
+        coeff_mod_bit_sizes = [first_bits] + [scale_bits] * depth + [first_bits]
+        if sum(coeff_mod_bit_sizes) <= max_bits:
+            return {
+                'scheme': 'CKKS',
+                'poly_modulus_degree': degree,
+                'coeff_mod_bit_sizes': coeff_mod_bit_sizes,
+                'global_scale': ckks_scale(scale_bits, depth, degree),
+                'slot_count': degree // 2,
+            }
+    raise ValueError("No secure CKKS parameters for this depth and precision")
+
+def plan_bfv(max_abs_value, rows=1, depth=0):
+    # Signed results live in [-t/2, t/2), so t must exceed twice the largest result
+    plain_bits = max(int(2 * max_abs_value * rows + 1).bit_length() + 1, 17)
+    for degree, max_bits in sorted(MAX_COEFF_MODULUS_BITS.items()):
+        # Each level costs roughly log2(t) + log2(N) bits of noise budget, plus a safety margin
+        if plain_bits > 60 or (plain_bits + math.log2(degree)) * (depth + 1) + 20 > max_bits:
+            continue
+        return {
+            'scheme': 'BFV',
+            'poly_modulus_degree': degree,
+            'coeff_mod_bit_sizes': [],  # SEAL's default modulus for this degree
+            'plain_modulus': batching_prime(plain_bits, degree),
+            'slot_count': degree,
+        }
+    raise ValueError("No secure BFV parameters for this depth and value range")
+
+def plan_parameters(scheme, max_abs_value, rows=1, depth=0, precision_bits=20):
+    """Smallest secure parameters for a computation.
+
+    max_abs_value is the largest absolute input value, rows the number of values summed
+    into one result (1 for element-wise operations) and depth the number of
+    multiplications on the longest path. precision_bits is the number of significant
+    bits CKKS keeps of the largest intermediate value.
+    """
+    if scheme == 'CKKS':
+        return plan_ckks(max_abs_value, rows, depth, precision_bits)
+    elif scheme == 'BFV':
+        return plan_bfv(max_abs_value, rows, depth)
+    raise ValueError("Invalid scheme, use either 'CKKS' or 'BFV'")
+
+def plan_frame(scheme, df, operation, precision_bits=20):
+    """Smallest secure parameters for a case study operation on the numeric columns of df.
+
+    Both operations double the values. A frame without numeric values (no rows, no numeric
+    columns or only NaN) gives NaN here and is planned like one whose values are at most 1;
+    a bound of 0 leaves CKKS no room for the encoded values above the scale.
+    """
+    max_abs_value = float(df.select_dtypes(include=['int64', 'float64']).abs().max().max())
+    if math.isnan(max_abs_value):
+        max_abs_value = 0.0
+    return plan_parameters(scheme, max(2 * max_abs_value, 1.0), depth=OPERATION_DEPTH.get(operation, 1),
+                           precision_bits=precision_bits)
+
+def build_context(plan, galois_keys=False, n_threads=None):
+    """Build a ts.Context from a plan; Galois keys are only needed for rotations (sums).
+
+    n_threads sizes TenSEAL's own thread pool (all cores when None).
+    """
+    if plan['scheme'] == 'CKKS':
+        context = ts.context(
+            ts.SCHEME_TYPE.CKKS,
+            poly_modulus_degree=plan['poly_modulus_degree'],
+            coeff_mod_bit_sizes=plan['coeff_mod_bit_sizes'],
+            n_threads=n_threads
+        )
+        context.global_scale = plan['global_scale']
+    else:
+        context = ts.context(
+            ts.SCHEME_TYPE.BFV,
+            poly_modulus_degree=plan['poly_modulus_degree'],
+            plain_modulus=plan['plain_modulus'],
+            coeff_mod_bit_sizes=plan['coeff_mod_bit_sizes'],
+            n_threads=n_threads
+        )
+    if galois_keys:
+        context.generate_galois_keys()
+    return context
+
+def check_precision(plan, max_abs_value, depth=0, precision_bits=20, seed=0):
+    """Largest error of `depth` multiplications by a plain scalar on a full CKKS vector.
+
+    The inputs are drawn so that the results reach max_abs_value. Raises ValueError when
+    the error exceeds 2**-precision_bits * max_abs_value, i.e. when the plan keeps fewer
+    than precision_bits significant bits.
+    """
+    context = build_context(plan)
+    values = np.random.default_rng(seed).uniform(-1, 1, plan['slot_count']) * max_abs_value / 2 ** depth
+    encrypted = ts.ckks_vector(context, values)
+    for _ in range(depth):
+        encrypted = encrypted * 2
+    error = float(np.max(np.abs(np.asarray(encrypted.decrypt()) - values * 2 ** depth)))
+    if error > 2.0 ** -precision_bits * max_abs_value:
+        raise ValueError("Error %.3g keeps fewer than %d bits of %g" % (error, precision_bits, max_abs_value))
+    return error
+
+if __name__ == "__main__":
+    # Check the element-wise plans over a range of values and depths
+    for depth in (0, 1, 2):
+        for max_abs_value in (1.0, 250.0, 8e4, 1e6):
+            plan = plan_ckks(max_abs_value, depth=depth)
+            error = check_precision(plan, max_abs_value, depth)
+            print("depth %d, max %g: %s, error %.3g" % (depth, max_abs_value, plan['coeff_mod_bit_sizes'], error))
@@ -1,6 +1,16 @@
+import base64
+import hashlib
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+import numpy as np
 import requests
 import json
+import tenseal as ts
+from columnar import is_columnar, encode_frame, decode_frame
+from fhe_params import plan_parameters, build_context
+from backends import HttpBackend, create_session, get_backend
 
 # Sample dataset definition
 data = {
@@ -18,74 +28,334 @@ data = {
 df_sample = pd.DataFrame(data)
 
 def df_to_dict(df):
-    """Convert DataFrame to dictionary format for Lambda."""
+    """Convert DataFrame to the row-wise format, still accepted by both Lambdas."""
     return {
         'columns': df.columns.tolist(),
         'data': df.values.tolist()
     }
 
-def prepare_data_for_lambda(df, sensitive_columns, operation):
-    """Prepare data for sending to the Lambda function."""
-    return {
-        'data': df_to_dict(df),
-        'sensitive_columns': sensitive_columns,
-        'operation': operation
+def prepare_data_for_lambda(df, sensitive_columns, operation, compression=None):
+    """Prepare data for sending to the Lambda function, in the columnar wire format.
+
+    operation can also be a list of operations, which the non-sensitive Lambda computes
+    in a single request.
+    """
+    request = {
+        'data': encode_frame(df, compression),
+        'sensitive_columns': sensitive_columns
     }
+    if isinstance(operation, (list, tuple)):
+        request['operations'] = list(operation)
+    else:
+        request['operation'] = operation
+    return request
 
-def process_data(df, sensitive_columns, operation):
-    """Process data by sending requests to Lambda functions and combining results."""
-    data = prepare_data_for_lambda(df, sensitive_columns, operation)
-    non_sensitive_url = 'https://d1ci2kx43g.execute-api.eu-west-1.amazonaws.com/non_sensitive/'
-    sensitive_url = 'https://1gjf7bj3f0.execute-api.eu-west-1.amazonaws.com/sensitive/'
-    
-    try:
-        # Send request to process non-sensitive data
-        response_non_sensitive = requests.post(non_sensitive_url, json=data)
-        response_non_sensitive.raise_for_status()  # Raise an exception for HTTP errors
-        non_sensitive_results = response_non_sensitive.json()
-        
-        # Debugging: Print the non-sensitive results
-        print("Non-sensitive results:", non_sensitive_results)
-        
-        # Check if the response has the expected data
-        non_sensitive_body = json.loads(non_sensitive_results.get('body', '{}'))
-        if 'data' not in non_sensitive_body:
-            raise ValueError("Non-sensitive response does not contain 'data'")
-        
-        # Process non-sensitive data
-        non_sensitive_data = non_sensitive_body['data']
-        if isinstance(non_sensitive_data, dict):
-            # Convert the single row data into a DataFrame with the appropriate columns
-            non_sensitive_df = pd.DataFrame([non_sensitive_data], columns=non_sensitive_data.keys())
-        else:
-            raise ValueError("Non-sensitive data is not in the expected format")
-        
-        # Send request to process sensitive data
-        response_sensitive = requests.post(sensitive_url, json=data)
-        response_sensitive.raise_for_status()  # Raise an exception for HTTP errors
-        sensitive_results = response_sensitive.json()
-        
-        # Debugging: Print the sensitive results
-        print("Sensitive results:", sensitive_results)
-        
-        # Check if the response has the expected data
-        sensitive_body = json.loads(sensitive_results.get('body', '{}'))
-        if 'data' not in sensitive_body:
-            raise ValueError("Sensitive response does not contain 'data'")
-        
-        # Extract and process sensitive data
+# A synchronous Lambda invocation takes at most 6 MB of request payload
+MAX_REQUEST_BYTES = int(os.environ.get('MAX_REQUEST_BYTES', 6 * 1024 * 1024))
+# Room left in a request for everything but the column data (keys, names, the operation)
+REQUEST_OVERHEAD_BYTES = 64 * 1024
+
+class ClientKeyset:
+    """Long-lived client keys. The secret key stays here, only the public context is uploaded.
+
+    The sensitive Lambda adds encrypted chunks slot by slot and multiplies them by plain
+    scalars, so the public context carries neither Galois nor relinearization keys; the
+    slots of a sum are added up after decryption. One level is spent on the scalar.
+    """
+
+    def __init__(self, context=None, slot_count=4096):
+        if context is None:
+            context = ts.context(
+                ts.SCHEME_TYPE.CKKS,
+                poly_modulus_degree=slot_count * 2,
+                coeff_mod_bit_sizes=[60, 40, 60]
+            )
+            context.global_scale = 2**40
+        self.context = context
+        self.slot_count = slot_count
+        self.public_context = context.serialize(
+            save_secret_key=False, save_galois_keys=False, save_relin_keys=False
+        )
+        # Fail here rather than on the first request that carries the context
+        upload_bytes = 4 * math.ceil(len(self.public_context) / 3)
+        if upload_bytes > MAX_REQUEST_BYTES:
+            raise ValueError("Public context is %.1f MB encoded, over the %.1f MB request limit" % (
+                upload_bytes / 2**20, MAX_REQUEST_BYTES / 2**20
+            ))
+        self.fingerprint = hashlib.sha256(self.public_context).hexdigest()
+        self.uploaded = False
+        self._chunk_bytes = None
+
+    @classmethod
+    def for_data(cls, df, sensitive_columns, precision_bits=20):
+        """Keyset with the smallest parameters that fit these columns, see fhe_params.plan_parameters."""
+        numeric = df[sensitive_columns].select_dtypes(include=['int64', 'float64'])
+        max_abs_value = max(float(numeric.abs().max().max()) if numeric.size else 1.0, 1.0)
+        plan = plan_parameters('CKKS', max_abs_value, max(len(df), 1), 1, precision_bits)
+        return cls(build_context(plan), plan['slot_count'])
+
+    @classmethod
+    def load(cls, path):
+        """Load a keyset previously written with save()."""
+        with open(path, 'rb') as f:
+            context = ts.context_from(f.read())
+        # CKKS packs poly_modulus_degree / 2 values per ciphertext
+        return cls(context, context.seal_context().data.key_context_data().parms().poly_modulus_degree() // 2)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.context.serialize(save_secret_key=True))
+
+    def encrypt_columns(self, df, sensitive_columns):
+        """Encrypt the sensitive columns once; the result can be reused for many operations."""
+        encrypted_columns = {}
+        for column in sensitive_columns:
+            # Zero padding to whole chunks, so that the Lambda can add them slot by slot
+            values = np.zeros(max(-(-len(df) // self.slot_count), 1) * self.slot_count)
+            values[:len(df)] = df[column].to_numpy(dtype=float)
+            encrypted_columns[column] = [
+                base64.b64encode(ts.ckks_vector(self.context, values[i:i + self.slot_count]).serialize()).decode('ascii')
+                for i in range(0, len(values), self.slot_count)
+            ]
+        return {'row_count': len(df), 'columns': encrypted_columns}
+
+    def chunk_bytes(self):
+        """Encoded size of one ciphertext chunk, as it travels in a request."""
+        if self._chunk_bytes is None:
+            chunk = ts.ckks_vector(self.context, np.zeros(self.slot_count)).serialize()
+            self._chunk_bytes = 4 * math.ceil(len(chunk) / 3)
+        return self._chunk_bytes
+
+    def decrypt_column(self, chunks, length=None):
+        """Decrypted values of a column, the first length of them when given."""
+        return np.concatenate([
+            np.asarray(ts.ckks_vector_from(self.context, base64.b64decode(chunk)).decrypt())
+            for chunk in chunks
+        ])[:length]
+
+def check_request_size(request):
+    """Raise before sending a request the Lambda would reject for its size."""
+    size = len(json.dumps(request))
+    if size > MAX_REQUEST_BYTES:
+        raise ValueError("Request is %.1f MB, over the %.1f MB request limit" % (
+            size / 2**20, MAX_REQUEST_BYTES / 2**20
+        ))
+
+def post_lambda(backend, endpoint, request):
+    check_request_size(request)
+    results = backend.invoke(endpoint, request)
+    return results, json.loads(results.get('body', '{}'))
+
+def encrypted_batches(keyset, encrypted):
+    """Split the encrypted columns into {column: chunks} batches that each fit in a request.
+
+    Every batch leaves room for the public context, which a cold Lambda may ask for.
+    """
+    context_bytes = 4 * math.ceil(len(keyset.public_context) / 3)
+    chunks_per_request = (MAX_REQUEST_BYTES - REQUEST_OVERHEAD_BYTES - context_bytes) // keyset.chunk_bytes()
+    if chunks_per_request < 1:
+        raise ValueError("A %.1f MB ciphertext and the %.1f MB public context do not fit in the %.1f MB request limit" % (
+            keyset.chunk_bytes() / 2**20, context_bytes / 2**20, MAX_REQUEST_BYTES / 2**20
+        ))
+    batch, batch_chunks = {}, 0
+    for column, chunks in encrypted['columns'].items():
+        for chunk in chunks:
+            if batch_chunks == chunks_per_request:
+                yield batch
+                batch, batch_chunks = {}, 0
+            batch.setdefault(column, []).append(chunk)
+            batch_chunks += 1
+    if batch or not encrypted['columns']:
+        yield batch
+
+def post_encrypted(backend, keyset, encrypted, operation):
+    """Send ciphertexts to the sensitive Lambda, uploading the public context only when needed.
+
+    Columns that do not fit in one request are sent over several; the returned chunks of
+    each column are concatenated in order. row_count is the total in every request, so the
+    partial sums of an average add up to the average.
+    """
+    encrypted_columns = {}
+    for batch in encrypted_batches(keyset, encrypted):
+        request = {
+            'encrypted_columns': batch,
+            'row_count': encrypted['row_count'],
+            'operation': operation,
+            'context_fingerprint': keyset.fingerprint
+        }
+        if not keyset.uploaded:
+            request['context'] = base64.b64encode(keyset.public_context).decode('ascii')
+
+        results, body = post_lambda(backend, 'sensitive', request)
+
+        # A cold Lambda has not seen our context yet, so upload it and retry once
+        if body.get('error') == 'context_missing' and 'context' not in request:
+            request['context'] = base64.b64encode(keyset.public_context).decode('ascii')
+            results, body = post_lambda(backend, 'sensitive', request)
+
+        print("Sensitive results: status %s, %d bytes" % (results.get('statusCode'), len(results.get('body', ''))))
+        if 'encrypted_columns' not in body:
+            raise ValueError("Sensitive response does not contain 'encrypted_columns'")
+        keyset.uploaded = True
+        for column, chunks in body['encrypted_columns'].items():
+            encrypted_columns.setdefault(column, []).extend(chunks)
+    return encrypted_columns
+
+def fetch_non_sensitive(backend, data):
+    """Send a request to process non-sensitive data and return its results as a DataFrame.
+
+    A request with a list of operations returns {operation: DataFrame}.
+    """
+    non_sensitive_results, non_sensitive_body = post_lambda(backend, 'non_sensitive', data)
+
+    # Debugging: Print the non-sensitive results
+    print("Non-sensitive results:", non_sensitive_results)
+
+    # Check if the response has the expected data
+    if 'results' in non_sensitive_body:
+        return {
+            operation: parse_result_data(result)
+            for operation, result in non_sensitive_body['results'].items()
+        }
+    if 'data' not in non_sensitive_body:
+        raise ValueError("Non-sensitive response does not contain 'data'")
+    return parse_result_data(non_sensitive_body['data'])
+
+def parse_result_data(result_data):
+    # A columnar frame for element-wise operations, one value per column for reductions
+    if is_columnar(result_data):
+        return decode_frame(result_data)
+    elif isinstance(result_data, dict):
+        # Convert the single row data into a DataFrame with the appropriate columns
+        return pd.DataFrame([result_data], columns=result_data.keys())
+    raise ValueError("Result data is not in the expected format")
+
+def fetch_sensitive(backend, data):
+    """Send a request to process sensitive data and return its results as a DataFrame.
+
+    A plan request (a list of operations) returns {operation: DataFrame}.
+    """
+    sensitive_results, sensitive_body = post_lambda(backend, 'sensitive', data)
+
+    # Debugging: Print the sensitive results
+    print("Sensitive results:", sensitive_results)
+
+    # Check if the response has the expected data
+    if 'results' in sensitive_body:
+        return {
+            operation: parse_result_data(result)
+            for operation, result in sensitive_body['results'].items()
+        }
+    elif 'aggregates' in sensitive_body:
+        # Reductions come back as one value per column, like the non-sensitive results
+        return pd.DataFrame([sensitive_body['aggregates']])
+    elif 'data' in sensitive_body:
+        # Element-wise results keep the full frame
         sensitive_data = sensitive_body['data']
-        sensitive_df = pd.DataFrame(
+        if is_columnar(sensitive_data):
+            return decode_frame(sensitive_data)
+        return pd.DataFrame(
             sensitive_data['data'],
             columns=sensitive_data['columns'],
             index=sensitive_data.get('index', [])
         )
+    raise ValueError("Sensitive response does not contain 'aggregates' or 'data'")
+
+def fetch_encrypted(backend, keyset, df, sensitive_columns, operation, encrypted=None):
+    # Encrypt on the client and send only ciphertexts
+    if encrypted is None:
+        encrypted = keyset.encrypt_columns(df, sensitive_columns)
+    encrypted_results = post_encrypted(backend, keyset, encrypted, operation)
+    if operation in ('average', 'addition'):
+        # The Lambda returns per-slot sums, the total is the sum of the slots
+        return pd.DataFrame([{
+            column: keyset.decrypt_column(chunks).sum() for column, chunks in encrypted_results.items()
+        }])
+    return pd.DataFrame({
+        column: keyset.decrypt_column(chunks, encrypted['row_count']) for column, chunks in encrypted_results.items()
+    })
+
+def merge_results(columns, sensitive_columns, non_sensitive_df, sensitive_df):
+    """Reassemble the per-endpoint results in the original column order.
+
+    Each endpoint only answers for its own columns, so every column is taken from exactly
+    one side; columns an endpoint skipped (non-numeric ones) are left out.
+    """
+    merged = {}
+    for column in columns:
+        part = sensitive_df if column in sensitive_columns else non_sensitive_df
+        if part is not None and column in part.columns:
+            merged[column] = part[column].to_numpy()
+    return pd.DataFrame(merged)
+
+# Operations the sensitive Lambda can evaluate on encrypted data; client-encrypted columns
+# support fewer of them
+SENSITIVE_OPERATIONS = ('average', 'addition', 'multiplication', 'variance', 'std')
+ENCRYPTED_OPERATIONS = ('average', 'addition', 'multiplication')
+
+def process_data(df, sensitive_columns, operation, keyset=None, encrypted=None, compression=None, backend=None):
+    """Process data by sending requests to Lambda functions and combining results.
+
+    operation is one of 'average', 'addition', 'multiplication', 'min', 'max', 'variance'
+    and 'std', or a list of them; a list returns {operation: DataFrame} and each Lambda
+    computes all of them in one request. The sensitive Lambda always receives a plan, a
+    single operation being a plan of one step. Sensitive columns are left out of the
+    operations that cannot be evaluated on encrypted data (min and max; with a keyset also
+    variance and std).
+
+    Each Lambda only receives the columns it processes, and both are called concurrently,
+    so the latency is that of the slower call. backend is 'http' (the deployed Lambdas,
+    default), 'local', 'process' or a backend instance, see backends.py. With a
+    ClientKeyset the sensitive columns are encrypted on the client and the sensitive
+    Lambda only sees ciphertexts. Pass the output of keyset.encrypt_columns() as
+    `encrypted` to reuse the same ciphertexts across operations. compression='zlib'
+    compresses the column buffers on the wire.
+    """
+    operations = list(operation) if isinstance(operation, (list, tuple)) else [operation]
+    supported = ENCRYPTED_OPERATIONS if keyset is not None else SENSITIVE_OPERATIONS
+    sensitive_operations = [op for op in operations if op in supported]
+    sensitive_columns = [column for column in df.columns if column in sensitive_columns]
+    non_sensitive_columns = [column for column in df.columns if column not in sensitive_columns]
+    backend = get_backend(backend)
+    
+    try:
+        non_sensitive_future = plan_future = None
+        sensitive_futures = {}
+        with ThreadPoolExecutor(max_workers=1 + len(operations)) as executor:
+            if non_sensitive_columns:
+                non_sensitive_data = prepare_data_for_lambda(df[non_sensitive_columns], [], operation, compression)
+                non_sensitive_future = executor.submit(fetch_non_sensitive, backend, non_sensitive_data)
+            # Client-encrypted columns take one operation per request, so these run side by side
+            if sensitive_columns and sensitive_operations and keyset is not None:
+                # Encrypt once for all operations
+                if encrypted is None:
+                    encrypted = keyset.encrypt_columns(df, sensitive_columns)
+                for op in sensitive_operations:
+                    sensitive_futures[op] = executor.submit(
+                        fetch_encrypted, backend, keyset, df, sensitive_columns, op, encrypted
+                    )
+            elif sensitive_columns and sensitive_operations:
+                # Always sent as a plan (a single operation is a one-step plan), encrypted once
+                # by the sensitive Lambda; variance and std only exist as plan steps
+                sensitive_data = prepare_data_for_lambda(
+                    df[sensitive_columns], sensitive_columns, sensitive_operations, compression
+                )
+                plan_future = executor.submit(fetch_sensitive, backend, sensitive_data)
+            non_sensitive_result = non_sensitive_future.result() if non_sensitive_future else None
+            sensitive_results = {op: future.result() for op, future in sensitive_futures.items()}
+            if plan_future is not None:
+                sensitive_results = plan_future.result()
         
         # Combine non-sensitive and sensitive results
-        combined_df = pd.concat([non_sensitive_df, sensitive_df], axis=1)
-        combined_df = combined_df.loc[:, ~combined_df.columns.duplicated()]  # Remove duplicate columns
-
-        return combined_df
+        if not isinstance(operation, (list, tuple)):
+            return merge_results(df.columns, sensitive_columns, non_sensitive_result, sensitive_results.get(operation))
+        return {
+            op: merge_results(
+                df.columns, sensitive_columns,
+                non_sensitive_result[op] if non_sensitive_result else None, sensitive_results.get(op)
+            )
+            for op in operations
+        }
     
     except requests.exceptions.RequestException as e:
         print(f"Request failed: {e}")
@@ -94,6 +364,84 @@ def process_data(df, sensitive_columns, operation):
         print(f"Data format error: {e}")
         return None
 
+# Partitioned mode: rows per shard (by default as many as fit in MAX_REQUEST_BYTES, see
+# max_shard_rows) and the number of shards in flight at once
+SHARD_ROWS = int(os.environ.get('SHARD_ROWS', 0)) or None
+MAX_CONCURRENCY = int(os.environ.get('MAX_CONCURRENCY', 8))
+# Rows encoded to estimate the request bytes per row
+SIZE_SAMPLE_ROWS = 1000
+
+def max_shard_rows(df, sensitive_columns, keyset=None, compression=None):
+    """Most rows per shard whose requests to both Lambdas stay within MAX_REQUEST_BYTES.
+
+    The bytes per row are measured on encoded sample rows; with a keyset every sensitive
+    column costs one ciphertext chunk per slot_count rows, and the public context may ride
+    along, so shards are whole chunks.
+    """
+    sample = df.iloc[:SIZE_SAMPLE_ROWS]
+    sensitive = [column for column in df.columns if column in sensitive_columns]
+    non_sensitive = [column for column in df.columns if column not in sensitive_columns]
+    budget = MAX_REQUEST_BYTES - REQUEST_OVERHEAD_BYTES
+    if keyset is not None:
+        budget -= 4 * math.ceil(len(keyset.public_context) / 3)
+
+    row_bytes = []
+    if non_sensitive:
+        row_bytes.append(len(json.dumps(encode_frame(sample[non_sensitive], compression))) / len(sample))
+    if sensitive and keyset is not None:
+        row_bytes.append(len(sensitive) * keyset.chunk_bytes() / keyset.slot_count)
+    elif sensitive:
+        row_bytes.append(len(json.dumps(encode_frame(sample[sensitive], compression))) / len(sample))
+    shard_rows = int(budget / max(row_bytes)) if row_bytes else len(df)
+    if keyset is not None:
+        shard_rows -= shard_rows % keyset.slot_count
+    if shard_rows < 1:
+        raise ValueError("Not even one shard fits in the %.1f MB request limit" % (MAX_REQUEST_BYTES / 2**20))
+    return shard_rows
+
+def merge_partials(partials, operation, row_count):
+    """Combine per-shard results: element-wise shards are stacked, partial sums are added."""
+    if operation == 'multiplication':
+        return pd.concat(partials, ignore_index=True)
+    totals = pd.concat(partials, ignore_index=True).sum().to_frame().T
+    if operation == 'average':
+        totals = totals / row_count
+    return totals
+
+def process_data_partitioned(df, sensitive_columns, operation, keyset=None, shard_rows=SHARD_ROWS,
+                             max_concurrency=MAX_CONCURRENCY, backend=None, **kwargs):
+    """Like process_data, but the rows are split into shards that are processed concurrently.
+
+    At most max_concurrency shards are in flight, each calling both Lambdas. An average is
+    computed as per-shard sums divided by the total row count, so only mergeable partials
+    cross the wire. shard_rows defaults to the most rows that fit in one request, see
+    max_shard_rows. Other keyword arguments are passed on to process_data.
+    """
+    if operation not in ('average', 'addition', 'multiplication'):
+        raise ValueError("Invalid operation")
+    if shard_rows is None and len(df):
+        shard_rows = max_shard_rows(df, sensitive_columns, keyset, kwargs.get('compression'))
+    if len(df) <= (shard_rows or 0):
+        return process_data(df, sensitive_columns, operation, keyset, backend=backend, **kwargs)
+
+    # Every shard calls both endpoints, so size the connection pool of a default HTTP backend
+    if backend is None or isinstance(backend, str):
+        backend = get_backend(backend)
+        if isinstance(backend, HttpBackend):
+            backend = HttpBackend(session=create_session(pool_maxsize=2 * max_concurrency))
+    shard_operation = 'addition' if operation == 'average' else operation
+    shards = [df.iloc[i:i + shard_rows] for i in range(0, len(df), shard_rows)]
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        partials = list(executor.map(
+            lambda shard: process_data(shard, sensitive_columns, shard_operation, keyset, backend=backend, **kwargs),
+            shards
+        ))
+
+    # process_data has already reported the failure of a shard
+    if any(partial is None for partial in partials):
+        return None
+    return merge_partials(partials, operation, len(df))
+
 # Example usage
 if __name__ == "__main__":
     sensitive_columns = ['age', 'blood_pressure', 'cholesterol']
@@ -0,0 +1,55 @@
+"""Local stand-ins for the two API Gateway endpoints, for offline runs and benchmarks.
+
+    python local_lambda.py 8000
+    NON_SENSITIVE_URL=http://localhost:8000/non_sensitive/ \
+    SENSITIVE_URL=http://localhost:8000/sensitive/ python framework.py
+"""
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# sensitive.py lives in sensitive/ and imports its vendored tenseal, as in sensitive.zip
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sensitive'))
+
+import non_sensitive
+import sensitive
+
+HANDLERS = {
+    '/non_sensitive/': non_sensitive.lambda_handler,
+    '/sensitive/': sensitive.lambda_handler,
+}
+
+class LambdaRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like API Gateway
+
+    def do_POST(self):
+        handler = HANDLERS.get(self.path)
+        if handler is None:
+            self.send_error(404)
+            return
+        event = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        # Same shape as the Lambda integration: the handler's return value as JSON
+        body = json.dumps(handler(event, None)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(host='127.0.0.1', port=0):
+    """Start both endpoints in a background thread; returns (server, non_sensitive_url, sensitive_url)."""
+    server = ThreadingHTTPServer((host, port), LambdaRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://%s:%d' % server.server_address[:2]
+    return server, base_url + '/non_sensitive/', base_url + '/sensitive/'
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    server = ThreadingHTTPServer(('127.0.0.1', port), LambdaRequestHandler)
+    print("Serving /non_sensitive/ and /sensitive/ on port %d" % port)
+    server.serve_forever()
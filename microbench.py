@@ -0,0 +1,212 @@
+"""Per-operation microbenchmarks of the tenseal wrappers vendored in sensitive/.
+
+Every operation (PlainTensor construction, _get_operand, encryption, add, add_, mul, sum,
+dot, mm, serialize, decrypt, ...) is timed on CKKSVector, BFVVector, CKKSTensor and
+BFVTensor for each poly_modulus_degree and vector length. The suite reports operations per
+second and the bytes allocated per operation (Python allocations, as seen by tracemalloc;
+SEAL's own memory pool is not included).
+
+    python microbench.py --save-baseline baseline.json
+    python microbench.py --compare baseline.json --threshold 0.15
+
+With --compare, every result more than threshold slower (or allocating more) than the
+baseline is reported and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+# Benchmark the wrappers shipped in sensitive.zip, as local_lambda.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sensitive'))
+
+import tenseal as ts
+from fhe_params import batching_prime
+
+TYPES = ('CKKSVector', 'BFVVector', 'CKKSTensor', 'BFVTensor')
+DEGREES = (4096, 8192, 16384)
+LENGTHS = (64, 1024, 4096)
+OPERATIONS = ('plain_tensor', 'get_operand', 'encrypt', 'add', 'add_', 'add_plain', 'mul', 'mul_plain',
+              'sum', 'dot', 'mm', 'serialize', 'decrypt')
+# One multiplicative level, within fhe_params.MAX_COEFF_MODULUS_BITS for each degree
+CKKS_COEFF_MOD_BIT_SIZES = {4096: [40, 20, 40], 8192: [60, 40, 60], 16384: [60, 40, 40, 60]}
+CKKS_SCALE_BITS = {4096: 20, 8192: 40, 16384: 40}
+# Batched tensors hold a TENSOR_SHAPE matrix in every slot, so their length is the batch size
+TENSOR_SHAPE = (4, 4)
+MM_COLUMNS = 4
+# CKKSVector.mm does one rotation per row of the matrix; longer vectors take minutes
+MM_MAX_LENGTH = 256
+DEFAULT_THRESHOLD = 0.1
+
+def build_context(scheme, degree):
+    """Context with relinearization and Galois keys (sum, dot and mm rotate)."""
+    if scheme == 'CKKS':
+        context = ts.context(ts.SCHEME_TYPE.CKKS, degree,
+                             coeff_mod_bit_sizes=CKKS_COEFF_MOD_BIT_SIZES[degree])
+        context.global_scale = 2 ** CKKS_SCALE_BITS[degree]
+    else:
+        context = ts.context(ts.SCHEME_TYPE.BFV, degree, plain_modulus=batching_prime(20, degree))
+    context.generate_galois_keys()
+    return context
+
+def slot_count(scheme, degree):
+    return degree // 2 if scheme == 'CKKS' else degree
+
+def make_operations(type_name, context, length, rng):
+    """{operation: callable} for one tensor type and length; unsupported operations are left out."""
+    scheme = type_name[:-len('Vector')] if type_name.endswith('Vector') else type_name[:-len('Tensor')]
+    dtype = 'float' if scheme == 'CKKS' else 'int'
+    draw = (lambda shape: rng.uniform(-8, 8, shape)) if scheme == 'CKKS' else (lambda shape: rng.integers(0, 8, shape))
+    cls = getattr(ts, type_name)
+
+    if type_name.endswith('Vector'):
+        values = draw(length).tolist()
+        plain = draw(length).tolist()
+        encrypt = (lambda: ts.ckks_vector(context, values)) if scheme == 'CKKS' else (lambda: ts.bfv_vector(context, values))
+    else:
+        values = ts.plain_tensor(draw((length,) + TENSOR_SHAPE).tolist(), dtype=dtype)
+        plain = draw(TENSOR_SHAPE).tolist()
+        make = ts.ckks_tensor if scheme == 'CKKS' else ts.bfv_tensor
+        encrypt = lambda: make(context, values, batch=True)
+    encrypted = encrypt()
+    accumulator = encrypted.copy()
+    raw = draw(length).tolist()
+
+    operations = {
+        'plain_tensor': lambda: ts.plain_tensor(raw, dtype=dtype),
+        'get_operand': lambda: cls._get_operand(plain, dtype=dtype),
+        'encrypt': encrypt,
+        'add': lambda: encrypted + encrypted,
+        'add_': lambda: accumulator.add_(encrypted),
+        'add_plain': lambda: encrypted + plain,
+        'mul': lambda: encrypted * encrypted,
+        'mul_plain': lambda: encrypted * plain,
+        'sum': lambda: encrypted.sum(),
+        'dot': lambda: encrypted.dot(encrypted),
+        'serialize': lambda: encrypted.serialize(),
+        'decrypt': lambda: encrypted.decrypt(),
+    }
+    if type_name == 'CKKSVector' and length <= MM_MAX_LENGTH:
+        matrix = draw((length, MM_COLUMNS)).tolist()
+        operations['mm'] = lambda: encrypted.mm(matrix)
+    elif type_name.endswith('Tensor'):
+        operations['mm'] = lambda: encrypted.mm(plain)
+    return operations
+
+def time_operation(operation, min_time=0.2, repeats=3):
+    """Best operations per second over `repeats` timings of at least min_time seconds each."""
+    # Calibrate the number of calls per timing, like timeit's autorange
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed * 10 >= min_time else 10
+    best = elapsed
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        best = min(best, time.perf_counter() - start)
+    return number / best
+
+def allocated_bytes(operation):
+    """Bytes allocated by one call (tracemalloc peak above the starting point)."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - start
+
+def result_key(type_name, degree, length, operation):
+    return "%s/%d/%d/%s" % (type_name, degree, length, operation)
+
+def run_suite(types=TYPES, degrees=DEGREES, lengths=LENGTHS, operations=OPERATIONS, min_time=0.2, seed=0):
+    """{key: {'ops_per_sec', 'bytes'}} for every supported combination; keys are type/degree/length/operation."""
+    rng = np.random.default_rng(seed)
+    results = {}
+    for degree in degrees:
+        contexts = {}
+        for type_name in types:
+            scheme = 'CKKS' if type_name.startswith('CKKS') else 'BFV'
+            if scheme not in contexts:
+                contexts[scheme] = build_context(scheme, degree)
+            for length in lengths:
+                # A vector has to fit in one ciphertext; a batched tensor holds length matrices
+                if length > slot_count(scheme, degree):
+                    continue
+                available = make_operations(type_name, contexts[scheme], length, rng)
+                for operation in operations:
+                    if operation not in available:
+                        continue
+                    key = result_key(type_name, degree, length, operation)
+                    results[key] = {
+                        'ops_per_sec': time_operation(available[operation], min_time),
+                        'bytes': allocated_bytes(available[operation]),
+                    }
+                    print("%-40s %12.1f ops/s %12d bytes" % (key, results[key]['ops_per_sec'], results[key]['bytes']))
+    return results
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Keys of `results` that are more than threshold slower than, or allocate more than, the baseline.
+
+    Returns a list of (key, metric, baseline value, current value).
+    """
+    regressions = []
+    for key, current in sorted(results.items()):
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        if current['ops_per_sec'] < previous['ops_per_sec'] * (1 - threshold):
+            regressions.append((key, 'ops_per_sec', previous['ops_per_sec'], current['ops_per_sec']))
+        # A few bytes of noise on tiny allocations are not regressions
+        if current['bytes'] > previous['bytes'] * (1 + threshold) + 64:
+            regressions.append((key, 'bytes', previous['bytes'], current['bytes']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmark the tenseal tensor wrappers.")
+    parser.add_argument('--types', nargs='+', choices=TYPES, default=list(TYPES))
+    parser.add_argument('--degrees', nargs='+', type=int, choices=DEGREES, default=list(DEGREES))
+    parser.add_argument('--lengths', nargs='+', type=int, default=list(LENGTHS))
+    parser.add_argument('--operations', nargs='+', choices=OPERATIONS, default=list(OPERATIONS))
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds per timing")
+    parser.add_argument('--save-baseline', metavar='FILE', help="write the results as a baseline")
+    parser.add_argument('--compare', metavar='FILE', help="baseline to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slow-down or allocation growth reported as a regression")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.types, args.degrees, args.lengths, args.operations, args.min_time)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({
+                'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                                'tenseal': ts.__version__},
+                'results': results,
+            }, f, indent=2)
+        print("Baseline written to %s" % args.save_baseline)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for key, metric, previous, current in regressions:
+            print("REGRESSION %s %s: %.1f -> %.1f" % (key, metric, previous, current))
+        if regressions:
+            return 1
+        print("No regressions beyond %.0f%%" % (args.threshold * 100))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,31 +1,111 @@
 import json
-import pandas as pd
+import numpy as np
+from columnar import is_columnar, encode_columns, decode_columns
+
+def load_columns(data):
+    """The request's columns as {name: numpy array}, with the shape checked once for all rows."""
+    if is_columnar(data):
+        # decode_columns checks that all columns have the same length
+        columns = decode_columns(data)
+        return columns, data['length']
+
+    if 'columns' not in data or 'data' not in data:
+        raise ValueError("Invalid data format")
+    names = data['columns']
+    rows = data['data']
+    if not rows:
+        return {name: np.array([]) for name in names}, 0
+
+    # Rows of different lengths do not form a 2-D array
+    try:
+        values = np.array(rows)
+    except ValueError:
+        raise ValueError("Mismatch between number of columns and data length")
+    if values.ndim != 2 or values.shape[1] != len(names):
+        raise ValueError("Mismatch between number of columns and data length")
+    if values.dtype.kind not in 'biuf':
+        # Mixed rows (numbers and strings) become strings, so infer each column on its own
+        values = np.array(rows, dtype=object)
+        return {name: np.array(values[:, i].tolist()) for i, name in enumerate(names)}, len(rows)
+    return {name: values[:, i] for i, name in enumerate(names)}, len(rows)
+
+# Operations that reduce each column to one value; several can be requested at once
+REDUCING_OPERATIONS = ('average', 'addition', 'min', 'max', 'variance', 'std')
+
+def column_statistic(values, total, row_count, operation):
+    if operation == 'addition':
+        return total.item()
+    if row_count == 0 or (operation in ('variance', 'std') and row_count < 2):
+        return float('nan')
+    if operation == 'average':
+        return float(total / row_count)
+    elif operation == 'min':
+        return values.min().item()
+    elif operation == 'max':
+        return values.max().item()
+    elif operation in ('variance', 'std'):
+        # Sample variance and standard deviation, like pandas
+        deviations = values - total / row_count
+        variance = float(np.dot(deviations, deviations) / (row_count - 1))
+        return variance if operation == 'variance' else variance ** 0.5
+
+def aggregate_columns(columns, row_count, operations):
+    """{operation: {column: value}} for the reducing operations, visiting each column once.
+
+    The column sum is shared by addition, average, variance and std; sums of integer columns stay
+    integers.
+    """
+    results = {operation: {} for operation in operations}
+    for name, values in columns.items():
+        if values.dtype.kind not in 'biuf':
+            continue
+        # Summing each column where it lies avoids stacking them into a 2-D copy
+        total = values.sum()
+        for operation in operations:
+            results[operation][name] = column_statistic(values, total, row_count, operation)
+    return results
+
+def multiply_columns(columns):
+    # Non-numeric columns pass through unchanged
+    return {
+        name: values * 2 if values.dtype.kind in 'biuf' else values
+        for name, values in columns.items()
+    }
+
+def multiplied_frame(columns, row_count, data):
+    # Element-wise results go back as a columnar frame, which is JSON-safe
+    compression = data.get('compression') if is_columnar(data) else None
+    return encode_columns(multiply_columns(columns), row_count, compression)
 
 def lambda_handler(event, context):
     try:
         # Extract and validate the data
         data = event.get('data', {})
-        if 'columns' not in data or 'data' not in data:
-            raise ValueError("Invalid data format")
-
-        columns = data['columns']
-        rows = data['data']
-
-        # Validate that all rows have the same length
-        if not all(len(row) == len(columns) for row in rows):
-            raise ValueError("Mismatch between number of columns and data length")
+        columns, row_count = load_columns(data)
 
-        # Create DataFrame
-        df = pd.DataFrame(rows, columns=columns)
+        # A list of operations is answered in one response, keyed per operation
+        operations = event.get('operations')
+        if operations is not None:
+            invalid = [operation for operation in operations
+                       if operation not in REDUCING_OPERATIONS and operation != 'multiplication']
+            if invalid:
+                raise ValueError("Invalid operation: %s" % ', '.join(invalid))
+            results = aggregate_columns(
+                columns, row_count, [operation for operation in operations if operation in REDUCING_OPERATIONS]
+            )
+            if 'multiplication' in operations:
+                results['multiplication'] = multiplied_frame(columns, row_count, data)
+            return {
+                'statusCode': 200,
+                'body': json.dumps({'results': results})
+            }
 
         # Perform operations
         operation = event.get('operation', '')
-        if operation == 'average':
-            result = df.mean().to_dict()
-        elif operation == 'addition':
-            result = df.sum().to_dict()
+        if operation in REDUCING_OPERATIONS:
+            result = aggregate_columns(columns, row_count, [operation])[operation]
         elif operation == 'multiplication':
-            result = df * 2
+            result = multiplied_frame(columns, row_count, data)
         else:
             result = {"error": "Invalid operation"}
 
@@ -0,0 +1,56 @@
+"""Build the deployment packages of both Lambdas.
+
+sensitive.zip holds the sensitive/ directory (sensitive.py and the tenseal it bundles) and
+the shared modules it imports from the repository root; non_sensitive.zip holds
+non_sensitive.py and the same wire format module. Both handlers import the shared modules
+as top-level modules, so they sit at the root of each archive.
+
+    python package_lambdas.py --output dist
+"""
+import argparse
+import os
+import sys
+import zipfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Modules at the repository root that the handlers import
+SHARED_MODULES = {
+    'sensitive': ('fhe_params.py', 'columnar.py'),
+    'non_sensitive': ('columnar.py',),
+}
+SKIPPED_DIRECTORIES = ('__pycache__',)
+
+def add_directory(archive, directory):
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = sorted(name for name in dirnames if name not in SKIPPED_DIRECTORIES)
+        for filename in sorted(filenames):
+            if filename.endswith('.pyc'):
+                continue
+            path = os.path.join(dirpath, filename)
+            archive.write(path, os.path.relpath(path, directory))
+
+def build_package(name, output_dir):
+    """Write name.zip to output_dir and return its path."""
+    path = os.path.join(output_dir, name + '.zip')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        if name == 'sensitive':
+            add_directory(archive, os.path.join(ROOT, 'sensitive'))
+        else:
+            archive.write(os.path.join(ROOT, 'non_sensitive.py'), 'non_sensitive.py')
+        for module in SHARED_MODULES[name]:
+            archive.write(os.path.join(ROOT, module), module)
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the Lambda deployment packages.")
+    parser.add_argument('--output', default=ROOT, help="directory the zip files are written to")
+    parser.add_argument('--packages', nargs='+', choices=tuple(SHARED_MODULES), default=list(SHARED_MODULES))
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    for name in args.packages:
+        path = build_package(name, args.output)
+        print("%s written (%.1f MB)" % (path, os.path.getsize(path) / 2 ** 20))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,78 +1,541 @@
+import base64
+import hashlib
 import json
+import math
+import os
+import threading
+from collections import OrderedDict
 import tenseal as ts
 import pandas as pd
+import numpy as np
+from fhe_params import plan_parameters, ckks_scale, MAX_COEFF_MODULUS_BITS
+from columnar import is_columnar, encode_frame, decode_frame
 
-def setup_tenseal():
+POLY_MODULUS_DEGREE = 8192
+COEFF_MOD_BIT_SIZES = [60, 40, 40, 60]
+GLOBAL_SCALE = 2**40
+# A CKKS ciphertext holds poly_modulus_degree / 2 values
+SLOT_COUNT = POLY_MODULUS_DEGREE // 2
+
+# Contexts are kept across warm invocations, least recently used first out
+CONTEXT_CACHE_MAX_ENTRIES = int(os.environ.get('CONTEXT_CACHE_MAX_ENTRIES', 4))
+CONTEXT_CACHE_MAX_BYTES = int(os.environ.get('CONTEXT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+_context_cache = OrderedDict()  # parameters -> (context, key material bytes)
+# Threaded servers (local_lambda.py) handle several invocations at once
+_context_cache_lock = threading.Lock()
+
+# Multiplicative depth per operation; packed sums spend one level on the segment_sum mask
+OPERATION_DEPTH = {'addition': 0, 'average': 1, 'multiplication': 1}
+PACKED_OPERATION_DEPTH = {
+    'addition': 1, 'average': 2, 'multiplication': 1,
+    'variance': 2, 'std': 2, 'scale': 1, 'weighted_sum': 1
+}
+PLAN_OPERATIONS = tuple(PACKED_OPERATION_DEPTH)
+
+# Planned parameters are rounded to a few fixed sets, so that requests over similar data
+# share a cached context: 60-bit outer primes, the integer bits rounded up to a multiple of
+# INTEGER_ROUNDING_BITS and the largest scale that leaves room for them
+INTEGER_ROUNDING_BITS = 4
+
+# Operations that reduce each column to one value; their responses carry only the aggregates
+REDUCING_OPERATIONS = ('average', 'addition')
+
+def setup_tenseal(scheme=ts.SCHEME_TYPE.CKKS, poly_modulus_degree=POLY_MODULUS_DEGREE,
+                  coeff_mod_bit_sizes=COEFF_MOD_BIT_SIZES, global_scale=GLOBAL_SCALE):
     context = ts.context(
-        ts.SCHEME_TYPE.CKKS,
-        poly_modulus_degree=8192,
-        coeff_mod_bit_sizes=[60, 40, 40, 60]
+        scheme,
+        poly_modulus_degree=poly_modulus_degree,
+        coeff_mod_bit_sizes=coeff_mod_bit_sizes
     )
+    # Packed sums only need the left power-of-two rotations (see pack_columns), but this
+    # context never leaves the Lambda. generate_galois_keys(steps=...) still generates the
+    # full set first and then writes the restricted one over it: 0.23 s against 0.15 s for
+    # N = 8192, for half the key bytes. That only pays off for contexts that are serialized
     context.generate_galois_keys()
-    context.global_scale = 2**40
+    context.global_scale = global_scale
     return context
 
+def plan_sensitive_parameters(df, sensitive_columns, operation, packed=True):
+    """Smallest CKKS parameters that fit the sensitive columns and the operation or plan."""
+    numeric = df[sensitive_columns].select_dtypes(include=['int64', 'float64'])
+    if not numeric.size:
+        max_abs_value = 1.0
+    elif packed:
+        # Packed columns are encrypted centered on their midrange, see evaluate_packed_plan
+        max_abs_value = float(((numeric.max() - numeric.min()) / 2).max())
+    else:
+        max_abs_value = float(numeric.abs().max().max())
+    max_abs_value = max(max_abs_value, 1.0)
+    rows = max(len(df), 1)
+    if isinstance(operation, (list, tuple)):
+        steps = normalize_plan(operation)
+    else:
+        steps = [{'operation': operation}]
+
+    # The plan has to fit its largest intermediate value and its deepest step
+    largest, summed, depth = 1.0, 1, 0
+    for step in steps:
+        name = step['operation']
+        if name == 'multiplication':
+            value, count = 2 * max_abs_value, 1
+        elif name == 'scale':
+            value, count = abs(step.get('factor', 1.0)) * max_abs_value, 1
+        elif name in ('variance', 'std'):
+            value, count = max_abs_value ** 2, rows
+        elif name == 'weighted_sum':
+            value, count = max(np.abs(step['weights']).max(), 1.0) * max_abs_value, rows
+        else:
+            value, count = max_abs_value, rows
+        largest, summed = max(largest, value), max(summed, count)
+        depth = max(depth, (PACKED_OPERATION_DEPTH if packed else OPERATION_DEPTH).get(name, 1))
+    return round_parameters(plan_parameters('CKKS', largest, summed, depth))
+
+def round_parameters(params):
+    """CKKS params rounded to a fixed set, see INTEGER_ROUNDING_BITS; params when none fits.
+
+    The scale only drops below the planned one for plans that had already run out of
+    room under 60-bit primes, and then by less than INTEGER_ROUNDING_BITS bits.
+    """
+    degree = params['poly_modulus_degree']
+    coeff_mod_bit_sizes = params['coeff_mod_bit_sizes']
+    depth = len(coeff_mod_bit_sizes) - 2
+    scale_bits = coeff_mod_bit_sizes[1] if depth else round(math.log2(params['global_scale']))
+    int_bits = coeff_mod_bit_sizes[0] - scale_bits
+
+    rounded_int_bits = -(-int_bits // INTEGER_ROUNDING_BITS) * INTEGER_ROUNDING_BITS
+    rounded_scale_bits = 60 - rounded_int_bits
+    if depth:
+        rounded_scale_bits = min(rounded_scale_bits, (MAX_COEFF_MODULUS_BITS[degree] - 120) // depth)
+    if (rounded_scale_bits < 20 or 120 + depth * rounded_scale_bits > MAX_COEFF_MODULUS_BITS[degree]
+            or (rounded_scale_bits < scale_bits and scale_bits + int_bits < 60)):
+        return params
+    return dict(
+        params,
+        coeff_mod_bit_sizes=[60] + [rounded_scale_bits] * depth + [60],
+        global_scale=ckks_scale(rounded_scale_bits, depth, degree)
+    )
+
+def galois_key_count(poly_modulus_degree):
+    """Number of Galois keys setup_tenseal generates: every power-of-two step in both directions."""
+    return 2 * int(math.log2(poly_modulus_degree // 2))
+
+def key_material_size(poly_modulus_degree, coeff_mod_bit_sizes, galois_keys):
+    """In-memory bytes of the public keys of a setup_tenseal context, from its parameters.
+
+    Serializing the context to measure it costs as much as building it. Each Galois key and
+    the relinearization key hold one ciphertext pair per data prime over all the primes,
+    8 bytes per coefficient; the public key is one more pair.
+    """
+    primes = len(coeff_mod_bit_sizes)
+    pair_bytes = 2 * poly_modulus_degree * primes * 8
+    return ((galois_keys + 1) * (primes - 1) + 1) * pair_bytes
+
+def get_cached_context(scheme=ts.SCHEME_TYPE.CKKS, poly_modulus_degree=POLY_MODULUS_DEGREE,
+                       coeff_mod_bit_sizes=COEFF_MOD_BIT_SIZES, global_scale=GLOBAL_SCALE):
+    """Return (context, hit) for the given parameters, building the context on a miss."""
+    key = (scheme.name, poly_modulus_degree, tuple(coeff_mod_bit_sizes), global_scale)
+    context = cached_context(key)
+    if context is not None:
+        return context, True
+
+    context = setup_tenseal(scheme, poly_modulus_degree, coeff_mod_bit_sizes, global_scale)
+    size = key_material_size(poly_modulus_degree, coeff_mod_bit_sizes, galois_key_count(poly_modulus_degree))
+    cache_context(key, context, size)
+    return context, False
+
+def cached_context(key):
+    with _context_cache_lock:
+        if key not in _context_cache:
+            return None
+        _context_cache.move_to_end(key)
+        return _context_cache[key][0]
+
+def cache_context(key, context, size):
+    with _context_cache_lock:
+        _context_cache[key] = (context, size)
+
+        # Evict the least recently used contexts until both caps hold again
+        while _context_cache and (
+            len(_context_cache) > CONTEXT_CACHE_MAX_ENTRIES
+            or sum(size for _, size in _context_cache.values()) > CONTEXT_CACHE_MAX_BYTES
+        ):
+            _context_cache.popitem(last=False)
+
+def get_public_context(fingerprint, blob=None):
+    """Return (context, hit) for a client's public context, loading it from blob on a miss."""
+    key = ('public', fingerprint)
+    context = cached_context(key)
+    if context is not None:
+        return context, True
+    if blob is None:
+        return None, False
+
+    blob = base64.b64decode(blob)
+    if hashlib.sha256(blob).hexdigest() != fingerprint:
+        raise ValueError("Context does not match its fingerprint")
+    context = ts.context_from(blob)
+    if context.has_secret_key():
+        raise ValueError("Client context must not contain the secret key")
+    cache_context(key, context, len(blob))
+    return context, False
+
 def encrypt_value(value, context):
     return ts.ckks_vector(context, [float(value)])
 
 def decrypt_value(encrypted_value):
     return encrypted_value.decrypt()[0]
 
-def process_sensitive_data(df, sensitive_columns, operation):
-    context = setup_tenseal()
+def sum_chunks(encrypted_chunks):
+    # Slot-wise sum of equally sized chunks: no rotations, so a client context needs no
+    # Galois keys; the client adds up the slots after decryption
+    total = encrypted_chunks[0]
+    for chunk in encrypted_chunks[1:]:
+        total = total + chunk
+    return total
+
+# Packed mode: the sensitive columns are interleaved, so row r of column c sits in
+# slot r * stride + c, and spread over as few ciphertexts as possible. The stride is
+# n_columns rounded up to a power of two, so that every rotation of segment_sum is a
+# single power-of-two step.
+def next_power_of_two(n):
+    return 1 << (n - 1).bit_length() if n > 1 else 1
+
+def rows_per_chunk(stride, slot_count=SLOT_COUNT):
+    if stride > slot_count:
+        raise ValueError("Too many columns to pack into one ciphertext")
+    # A power of two, so that segment_sum needs log2(rows) rotations
+    return slot_count // stride
+
+def pack_columns(matrix, context, slot_count=SLOT_COUNT):
+    matrix = np.asarray(matrix, dtype=float)
+    n_rows, n_columns = matrix.shape
+    stride = next_power_of_two(n_columns)
+    step = rows_per_chunk(stride, slot_count)
+    encrypted_chunks = []
+    for i in range(0, n_rows, step):
+        block = matrix[i:i + step]
+        # Zero rows and columns pad the block to powers of two without changing any sum
+        padded = np.zeros((next_power_of_two(len(block)), stride))
+        padded[:len(block), :n_columns] = block
+        encrypted_chunks.append(ts.ckks_vector(context, padded.ravel()))
+    return encrypted_chunks
+
+def unpack_columns(encrypted_chunks, n_rows, n_columns):
+    values = np.concatenate([np.asarray(chunk.decrypt()) for chunk in encrypted_chunks])
+    return values.reshape(-1, next_power_of_two(n_columns))[:n_rows, :n_columns]
+
+def segment_sum(encrypted_chunk, stride):
+    """Per-column totals of an interleaved chunk, in the first stride slots of one ciphertext.
+
+    enc_matmul_plain reads the chunk as a stride x rows matrix stored column by column and
+    multiplies it with a vector of ones: one plaintext mask, then log2(rows) rotations by
+    multiples of stride.
+    """
+    n_rows = encrypted_chunk.size() // stride
+    return encrypted_chunk.enc_matmul_plain([1.0] * n_rows, stride)
+
+def sum_columns(encrypted_chunks, n_columns):
+    stride = next_power_of_two(n_columns)
+    total = segment_sum(encrypted_chunks[0], stride)
+    for chunk in encrypted_chunks[1:]:
+        total += segment_sum(chunk, stride)
+    return total
+
+def normalize_plan(operations):
+    """Plan steps as dicts with 'name' and 'operation'; a bare string is a step without arguments."""
+    steps = []
+    for step in operations:
+        step = {'operation': step} if isinstance(step, str) else dict(step)
+        if step.get('operation') not in PLAN_OPERATIONS:
+            raise ValueError("Invalid operation: %s" % step.get('operation'))
+        if step['operation'] == 'weighted_sum' and 'weights' not in step:
+            raise ValueError("weighted_sum needs 'weights'")
+        step.setdefault('name', step['operation'])
+        steps.append(step)
+    return steps
+
+def chunk_weights(weights, encrypted_chunks, stride, slot_count=SLOT_COUNT):
+    # Each chunk holds rows_per_chunk rows, padded with zero rows to a power of two
+    step = rows_per_chunk(stride, slot_count)
+    for i, chunk in enumerate(encrypted_chunks):
+        padded = np.zeros(chunk.size() // stride)
+        block = weights[i * step:(i + 1) * step]
+        padded[:len(block)] = block
+        yield chunk, padded
+
+def evaluate_packed_plan(matrix, steps, context, slot_count=SLOT_COUNT):
+    """Evaluate every step of a plan over one encryption of the matrix.
+
+    Returns {name: values}: one value per column for reductions, a rows x columns matrix
+    for element-wise steps. The column sums are shared by addition, average, variance and std.
+
+    The columns are encrypted centered on their midrange and the shift is undone after
+    decryption. The encrypted sums and squares stay small, which keeps CKKS precision
+    for variance, where (sum of squares - sum**2 / n) would otherwise cancel most of it.
+    """
+    n_rows, n_columns = matrix.shape
+    stride = next_power_of_two(n_columns)
+    offsets = (matrix.min(axis=0) + matrix.max(axis=0)) / 2
+    encrypted_chunks = pack_columns(matrix - offsets, context, slot_count)
+
+    totals = squares = None
+    results = {}
+    for step in steps:
+        operation = step['operation']
+        if operation in ('addition', 'average', 'variance', 'std') and totals is None:
+            totals = sum_columns(encrypted_chunks, n_columns)
+        if operation in ('variance', 'std') and squares is None:
+            squares = sum_columns([chunk.square() for chunk in encrypted_chunks], n_columns)
+
+        if operation == 'addition':
+            values = np.asarray(totals.decrypt())[:n_columns] + n_rows * offsets
+        elif operation == 'average':
+            values = np.asarray((totals * (1.0 / n_rows)).decrypt())[:n_columns] + offsets
+        elif operation in ('variance', 'std'):
+            # Sample variance from the encrypted sum and sum of squares, finished after
+            # decryption; the shift does not change it
+            total = np.asarray(totals.decrypt())[:n_columns]
+            sum_of_squares = np.asarray(squares.decrypt())[:n_columns]
+            if n_rows < 2:
+                values = np.full(n_columns, np.nan)
+            else:
+                values = np.maximum(sum_of_squares - total * total / n_rows, 0.0) / (n_rows - 1)
+            if operation == 'std':
+                values = np.sqrt(values)
+        elif operation in ('multiplication', 'scale'):
+            factor = 2 if operation == 'multiplication' else step.get('factor', 1.0)
+            values = unpack_columns([chunk * factor for chunk in encrypted_chunks], n_rows, n_columns) + factor * offsets
+        elif operation == 'weighted_sum':
+            weights = np.asarray(step['weights'], dtype=float)
+            if len(weights) != n_rows:
+                raise ValueError("weighted_sum needs one weight per row")
+            # enc_matmul_plain with the weights instead of ones: a dot product per column
+            pairs = chunk_weights(weights, encrypted_chunks, stride, slot_count)
+            chunk, chunk_weight = next(pairs)
+            weighted = chunk.enc_matmul_plain(chunk_weight.tolist(), stride)
+            for chunk, chunk_weight in pairs:
+                weighted += chunk.enc_matmul_plain(chunk_weight.tolist(), stride)
+            values = np.asarray(weighted.decrypt())[:n_columns] + weights.sum() * offsets
+        results[step['name']] = values
+    return results
+
+def process_packed_columns(matrix, operation, context, slot_count=SLOT_COUNT):
+    step = {'name': operation, 'operation': operation}
+    return evaluate_packed_plan(matrix, [step], context, slot_count)[operation]
+
+def process_sensitive_plan(df, sensitive_columns, operations, context, slot_count=SLOT_COUNT):
+    """{name: result} for a plan: {column: value} for reductions, a DataFrame for element-wise steps.
+
+    Each sensitive column is encrypted once, whatever the number of steps.
+    """
+    steps = normalize_plan(operations)
+    columns = [column for column in sensitive_columns if df[column].dtype in ['int64', 'float64']]
+    if not columns or len(df) == 0:
+        return {step['name']: ({} if step['operation'] not in ('multiplication', 'scale') else df.copy())
+                for step in steps}
+
+    processed = evaluate_packed_plan(df[columns].to_numpy(dtype=float), steps, context, slot_count)
+    results = {}
+    for step in steps:
+        values = processed[step['name']]
+        if values.ndim == 2:
+            frame = df.copy()
+            for i, column in enumerate(columns):
+                frame[column] = values[:, i]
+            results[step['name']] = frame
+        else:
+            results[step['name']] = {column: float(value) for column, value in zip(columns, values)}
+    return results
+
+def compute_sensitive_aggregates(df, sensitive_columns, operation, packed=True, context=None, slot_count=SLOT_COUNT):
+    """Per-column result of a reducing operation as {column: value}."""
+    if context is None:
+        context = setup_tenseal()
+    columns = [column for column in sensitive_columns if df[column].dtype in ['int64', 'float64']]
+    if not columns or len(df) == 0:
+        return {}
+
+    if packed:
+        processed = process_packed_columns(df[columns].to_numpy(dtype=float), operation, context, slot_count)
+        return {column: float(value) for column, value in zip(columns, processed)}
+
+    aggregates = {}
+    for column in columns:
+        encrypted_sum = encrypt_value(0, context)
+        for i in range(len(df)):
+            encrypted_value = encrypt_value(df[column].iloc[i], context)
+            encrypted_sum += encrypted_value
+        if operation == 'average':
+            encrypted_sum = encrypted_sum * (1.0 / len(df))
+        aggregates[column] = decrypt_value(encrypted_sum)
+    return aggregates
+
+def process_sensitive_data(df, sensitive_columns, operation, packed=True, context=None, slot_count=SLOT_COUNT):
+    if context is None:
+        context = setup_tenseal()
     results = df.copy()
 
-    for column in sensitive_columns:
-        if df[column].dtype in ['int64', 'float64']:
-            if operation == 'average':
-                encrypted_sum = encrypt_value(0, context)
-                count = len(df)
-                for i in range(count):
-                    encrypted_value = encrypt_value(df[column].iloc[i], context)
-                    encrypted_sum += encrypted_value
-                encrypted_avg = encrypted_sum * (1.0 / count)
-                results[column] = decrypt_value(encrypted_avg)
-            elif operation == 'addition':
-                encrypted_sum = encrypt_value(0, context)
-                for i in range(len(df)):
-                    encrypted_value = encrypt_value(df[column].iloc[i], context)
-                    encrypted_sum += encrypted_value
-                results[column] = decrypt_value(encrypted_sum)
-            elif operation == 'multiplication':
-                for i in range(len(df)):
-                    encrypted_value = encrypt_value(df[column].iloc[i], context)
-                    processed_value = encrypted_value * 2
-                    results.at[df.index[i], column] = decrypt_value(processed_value)
+    if operation in REDUCING_OPERATIONS:
+        aggregates = compute_sensitive_aggregates(df, sensitive_columns, operation, packed, context, slot_count)
+        for column, value in aggregates.items():
+            results[column] = value
+        return results
+
+    if operation != 'multiplication':
+        # variance, std and the other plan steps go through process_sensitive_plan
+        raise ValueError("Invalid operation")
+    columns = [column for column in sensitive_columns if df[column].dtype in ['int64', 'float64']]
+    if not columns or len(df) == 0:
+        return results
+
+    if packed:
+        processed = process_packed_columns(df[columns].to_numpy(dtype=float), operation, context, slot_count)
+        for i, column in enumerate(columns):
+            results[column] = processed[:, i]
+        return results
+
+    for column in columns:
+        for i in range(len(df)):
+            encrypted_value = encrypt_value(df[column].iloc[i], context)
+            processed_value = encrypted_value * 2
+            results.at[df.index[i], column] = decrypt_value(processed_value)
 
     return results
 
+# Client-side encryption: the request only carries ciphertexts and the client's public context
+def load_encrypted_column(chunks, context):
+    return [ts.ckks_vector_from(context, base64.b64decode(chunk)) for chunk in chunks]
+
+def serialize_encrypted_column(encrypted_chunks):
+    return [base64.b64encode(chunk.serialize()).decode('ascii') for chunk in encrypted_chunks]
+
+def process_encrypted_data(encrypted_columns, row_count, operation, context):
+    results = {}
+    for column, chunks in encrypted_columns.items():
+        encrypted_chunks = load_encrypted_column(chunks, context)
+        if operation == 'average':
+            processed = [sum_chunks(encrypted_chunks) * (1.0 / row_count)]
+        elif operation == 'addition':
+            processed = [sum_chunks(encrypted_chunks)]
+        elif operation == 'multiplication':
+            processed = [chunk * 2 for chunk in encrypted_chunks]
+        else:
+            raise ValueError("Invalid operation")
+        results[column] = serialize_encrypted_column(processed)
+    return results
+
+def handle_encrypted_request(event):
+    fingerprint = event.get('context_fingerprint')
+    if not fingerprint:
+        raise ValueError("Missing context fingerprint")
+
+    tenseal_context, cache_hit = get_public_context(fingerprint, event.get('context'))
+    if tenseal_context is None:
+        # The client resends the request together with its public context
+        return {
+            'statusCode': 409,
+            'body': json.dumps({'error': 'context_missing', 'context_fingerprint': fingerprint})
+        }
+
+    encrypted_columns = process_encrypted_data(
+        event['encrypted_columns'], event.get('row_count', 0), event.get('operation', ''), tenseal_context
+    )
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'encrypted_columns': encrypted_columns,
+            'context_cache': 'hit' if cache_hit else 'miss'
+        })
+    }
+
 def lambda_handler(event, context):
     try:
+        if 'encrypted_columns' in event:
+            return handle_encrypted_request(event)
+
         # Extract and validate data
         data = event.get('data', {})
-        if 'columns' not in data or 'data' not in data:
-            raise ValueError("Invalid data format")
+        columnar = is_columnar(data)
+        if columnar:
+            # decode_frame checks that all columns have the same length
+            df = decode_frame(data)
+        else:
+            if 'columns' not in data or 'data' not in data:
+                raise ValueError("Invalid data format")
 
-        columns = data['columns']
-        rows = data['data']
+            columns = data['columns']
+            rows = data['data']
 
-        # Validate that all rows have the same length
-        if not all(len(row) == len(columns) for row in rows):
-            raise ValueError("Mismatch between number of columns and data length")
+            # Validate that all rows have the same length
+            if not all(len(row) == len(columns) for row in rows):
+                raise ValueError("Mismatch between number of columns and data length")
 
-        # Create DataFrame
-        df = pd.DataFrame(rows, columns=columns)
+            # Create DataFrame
+            df = pd.DataFrame(rows, columns=columns)
         
         # Extract operation and sensitive columns
         operation = event.get('operation', '')
         sensitive_columns = event.get('sensitive_columns', [])
+        # A plan of several operations is evaluated over one encryption of the columns
+        operations = event.get('operations')
+        packed = event.get('packed', True) or operations is not None
+
+        # Size the parameters for this data unless the caller pins them, and reuse the
+        # context of a previous warm invocation when the parameters match
+        params = event.get('encryption_parameters') or plan_sensitive_parameters(
+            df, sensitive_columns, operations if operations is not None else operation, packed
+        )
+        poly_modulus_degree = params.get('poly_modulus_degree', POLY_MODULUS_DEGREE)
+        tenseal_context, cache_hit = get_cached_context(
+            ts.SCHEME_TYPE[params.get('scheme', 'CKKS')],
+            poly_modulus_degree,
+            params.get('coeff_mod_bit_sizes', COEFF_MOD_BIT_SIZES),
+            params.get('global_scale', GLOBAL_SCALE)
+        )
+
+        cache_status = 'hit' if cache_hit else 'miss'
+        slot_count = poly_modulus_degree // 2
+
+        if operations is not None:
+            results = process_sensitive_plan(df, sensitive_columns, operations, tenseal_context, slot_count)
+            for name, result in results.items():
+                if isinstance(result, pd.DataFrame):
+                    results[name] = encode_frame(result, data.get('compression') if columnar else None)
+            return {
+                'statusCode': 200,
+                'body': json.dumps({'results': results, 'row_count': len(df), 'context_cache': cache_status})
+            }
+
+        # One value per column is the whole answer of a reduction, so skip the frame
+        if operation in REDUCING_OPERATIONS:
+            aggregates = compute_sensitive_aggregates(
+                df, sensitive_columns, operation, packed, tenseal_context, slot_count
+            )
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'aggregates': aggregates,
+                    'row_count': len(df),
+                    'context_cache': cache_status
+                })
+            }
 
         # Process sensitive data
-        result_df = process_sensitive_data(df, sensitive_columns, operation)
+        result_df = process_sensitive_data(
+            df, sensitive_columns, operation, packed, tenseal_context, slot_count
+        )
         
+        # Frames answer in the format they were sent in
+        if columnar:
+            result_data = encode_frame(result_df, data.get('compression'))
+        else:
+            result_data = result_df.to_dict(orient='split')
         return {
             'statusCode': 200,
-            'body': json.dumps({'data': result_df.to_dict(orient='split')})
+            'body': json.dumps({
+                'data': result_data,
+                'context_cache': cache_status
+            })
         }
     except Exception as e:
         return {
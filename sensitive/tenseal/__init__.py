@@ -7,7 +7,14 @@ except ImportError:
     import tenseal._tenseal_cpp as _ts_cpp
 from tenseal.tensors import CKKSTensor, CKKSVector, BFVVector, BFVTensor, PlainTensor
 
-from tenseal.enc_context import Context, SCHEME_TYPE, ENCRYPTION_TYPE
+from tenseal.enc_context import (
+    Context,
+    SCHEME_TYPE,
+    ENCRYPTION_TYPE,
+    galois_steps,
+    register_context,
+    clear_context_registry,
+)
 from tenseal.version import __version__
 
 
@@ -160,6 +167,7 @@ __all__ = [
     "lazy_bfv_tensor_from",
     "context",
     "context_from",
+    "galois_steps",
     "im2col_encoding",
     "plain_tensor",
     "plain_tensor_from",
@@ -1,11 +1,15 @@
 """The Context manages everything related to the encrypted computation, including keys, which
 optimization should be enabled, and how many threads should run for a parallel computation.
 """
+import hashlib
 import multiprocessing
+import pickle
+import weakref
 from enum import Enum
 from typing import List, Union
 from abc import ABC
 import tenseal as ts
+from tenseal import sealapi
 
 
 class ENCRYPTION_TYPE(Enum):
@@ -86,6 +90,92 @@ class Decryptor(SEALPrimitive):
     pass
 
 
+def galois_steps(n_slots: int, stride: int = 1) -> List[int]:
+    """Rotation steps needed to sum up n_slots values that are stride slots apart, as done by
+    CKKSVector.sum() (stride 1) or CKKSVector.enc_matmul_plain() (stride = number of rows).
+
+    Args:
+        n_slots: number of values to sum up.
+        stride: distance in slots between two consecutive values.
+
+    Returns:
+        List of (left) rotation steps, to be passed to Context.generate_galois_keys().
+    """
+    return [stride << i for i in range(max(n_slots - 1, 0).bit_length())]
+
+
+def _galois_element(step: int, poly_modulus_degree: int) -> int:
+    """Galois element of a rotation by step slots, following SEAL's GaloisTool."""
+    m = 2 * poly_modulus_degree
+    if step == 0:
+        return m - 1
+    if abs(step) >= poly_modulus_degree // 2:
+        raise ValueError(f"rotation step {step} out of range")
+    if step < 0:
+        step += poly_modulus_degree // 2
+    return pow(3, step, m)
+
+
+# Contexts pickled or unpickled in this process, by fingerprint. Unpickled tensors link to
+# these instead of loading the keys again. Only the native contexts are held, and weakly: an
+# entry lasts as long as a Context (or its native object) is kept by its owner, so the
+# registry never keeps keys alive by itself.
+_context_registry = weakref.WeakValueDictionary()
+# Fingerprints already computed, per native context
+_fingerprints = weakref.WeakKeyDictionary()
+
+
+def register_context(context: "Context") -> str:
+    """Make a context available to tensors unpickled in this process.
+
+    Args:
+        context: the context to register. It replaces a registered context with the same
+            fingerprint only if it holds a secret key or Galois keys the other one lacks.
+
+    Returns:
+        The fingerprint of the context.
+    """
+    fingerprint = context.fingerprint()
+    registered = _context_registry.get(fingerprint)
+    if registered is None or (
+        context.has_secret_key() > registered.has_secret_key()
+        or context.has_galois_keys() > registered.has_galois_keys()
+    ):
+        _context_registry[fingerprint] = context.data
+    return fingerprint
+
+
+def registered_context(fingerprint: str) -> Union["Context", None]:
+    """Return the context registered under fingerprint, or None."""
+    registered = _context_registry.get(fingerprint)
+    return None if registered is None else Context._wrap(registered)
+
+
+def clear_context_registry():
+    """Forget every registered context; unpickled tensors are loaded lazily until the next one."""
+    _context_registry.clear()
+
+
+def _pickle_buffer(data: bytes, protocol: int):
+    """Wrap data so that pickle protocol 5 can hand it out of band (see pickle.PickleBuffer)."""
+    return pickle.PickleBuffer(data) if protocol >= 5 else data
+
+
+def _unpickle_context(fingerprint: str, has_secret_key: bool, has_galois_keys: bool, data) -> "Context":
+    """Return the registered context with the same keys, loading the buffer only if there is none."""
+    registered = _context_registry.get(fingerprint)
+    if (
+        registered is not None
+        and registered.has_secret_key() >= has_secret_key
+        and registered.has_galois_keys() >= has_galois_keys
+    ):
+        return Context._wrap(registered)
+    # The native loader only takes bytes, so out-of-band buffers are copied here
+    context = Context.load(bytes(data))
+    register_context(context)
+    return context
+
+
 class Context:
     def __init__(
         self,
@@ -178,6 +268,27 @@ class Context:
             return cls._wrap(ts._ts_cpp.TenSEALContext.deserialize(data, n_threads))
         return cls._wrap(ts._ts_cpp.TenSEALContext.deserialize(data))
 
+    def fingerprint(self) -> str:
+        """Hash of the encryption parameters and public key, shared by every copy of this
+        context whichever keys it holds.
+        """
+        fingerprint = _fingerprints.get(self.data)
+        if fingerprint is None:
+            public_part = self.data.serialize(True, False, False, False)
+            fingerprint = _fingerprints[self.data] = hashlib.sha256(public_part).hexdigest()
+        return fingerprint
+
+    def __reduce_ex__(self, protocol):
+        """Pickle through serialize(), keeping every key the context holds. With protocol 5
+        the serialized buffer can travel out of band.
+        """
+        fingerprint = register_context(self)
+        data = self.serialize(save_secret_key=self.has_secret_key())
+        return (
+            _unpickle_context,
+            (fingerprint, self.has_secret_key(), self.has_galois_keys(), _pickle_buffer(data, protocol)),
+        )
+
     def serialize(
         self,
         save_public_key: bool = True,
@@ -233,14 +344,38 @@ class Context:
     def galois_keys(self) -> GaloisKeys:
         return GaloisKeys(self.data.galois_keys())
 
-    def generate_galois_keys(self, secret_key: SecretKey = None):
-        if secret_key is None:
-            self.data.generate_galois_keys()
-        elif isinstance(secret_key, SecretKey):
-            self.data.generate_galois_keys(secret_key.data)
-        else:
+    @property
+    def poly_modulus_degree(self) -> int:
+        return self.data.seal_context().key_context_data().parms().poly_modulus_degree()
+
+    def generate_galois_keys(self, secret_key: SecretKey = None, steps: List[int] = None):
+        """Generate the Galois keys used for rotations.
+
+        Args:
+            secret_key: the secret key to generate the keys with, defaults to the context's own.
+            steps: only keep keys for these rotation steps, see galois_steps(). Keys for every
+                power-of-two step in both directions are generated when None.
+        """
+        if secret_key is not None and not isinstance(secret_key, SecretKey):
             raise TypeError(f"incorrect type: {type(secret_key)} != SecretKey")
 
+        # The native context only allocates the full key set, a restricted set is then
+        # written over it in place, so that serialize() only ships the requested keys.
+        # steps therefore costs more time than the full set (about 1.5x for N = 8192) and
+        # only pays off for contexts that are serialized, where it halves the key bytes.
+        if steps is None or not self.has_galois_keys():
+            if secret_key is None:
+                self.data.generate_galois_keys()
+            else:
+                self.data.generate_galois_keys(secret_key.data)
+        if steps is None:
+            return
+
+        secret_key = self.data.secret_key() if secret_key is None else secret_key.data
+        keygen = sealapi.KeyGenerator(self.data.seal_context(), secret_key)
+        elements = sorted({_galois_element(step, self.poly_modulus_degree) for step in steps})
+        keygen.create_galois_keys(elements, self.data.galois_keys())
+
     def has_relin_keys(self) -> bool:
         return self.data.has_relin_keys()
 
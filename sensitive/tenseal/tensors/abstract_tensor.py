@@ -4,6 +4,16 @@ import tenseal as ts
 from abc import ABC
 
 
+def _unpickle_tensor(cls, fingerprint, data) -> "AbstractTensor":
+    """Load a pickled tensor, linked to the registered context or lazily if there is none."""
+    # The native loaders only take bytes, so out-of-band buffers are copied here
+    data = bytes(data)
+    context = ts.enc_context.registered_context(fingerprint) if fingerprint else None
+    if context is None:
+        return cls.lazy_load(data)
+    return cls.load(context, data)
+
+
 class AbstractTensor(ABC):
     @property
     def data(self):
@@ -73,6 +83,19 @@ class AbstractTensor(ABC):
         """Serialize the tensor into a stream of bytes"""
         return self.data.serialize()
 
+    def __reduce_ex__(self, protocol):
+        """Pickle through serialize(). The context is not included: the unpickled tensor links
+        to the context registered under the same fingerprint in the receiving process (pickling
+        the context, or ts.enc_context.register_context(), registers it for as long as the
+        context is kept). With protocol 5 the serialized buffer can travel out of band.
+        """
+        try:
+            fingerprint = ts.enc_context.register_context(ts.Context._wrap(self.data.context()))
+        except ValueError:
+            fingerprint = None  # lazily loaded, no context linked yet
+        data = ts.enc_context._pickle_buffer(self.serialize(), protocol)
+        return (_unpickle_tensor, (type(self), fingerprint, data))
+
     @classmethod
     def _wrap(cls, data) -> "AbstractTensor":
         """Return a new tensor object wrapping the low level tensor object"""